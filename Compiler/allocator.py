@@ -403,11 +403,9 @@ class Merger:
             self.do_merge(merge)
             self.req_num[t.__name__, 'round'] += 1
 
-        preorder = None
-
         if len(instructions) > 1000000:
             print("Topological sort ...")
-        order = Compiler.graph.topological_sort(G, preorder)
+        order = G.topological_sort()
         instructions[:] = [instructions[i] for i in order if instructions[i] is not None]
         if len(instructions) > 1000000:
             print("Done at", time.asctime())
@@ -426,12 +424,13 @@ class Merger:
                                 triple='green', square='green', bit='green',\
                                 asm_input='lightgreen')
 
-        G = Compiler.graph.SparseDiGraph(len(block.instructions))
+        G = Compiler.graph.ArrayDiGraph(len(block.instructions))
         self.G = G
 
         reg_nodes = {}
-        last_def = defaultdict_by_id(lambda: -1)
-        last_read = defaultdict_by_id(list)
+        # keyed by id, the registers are kept alive by the instructions
+        last_def = {}
+        last_read = defaultdict(list)
         last_mem_write = []
         last_mem_read = []
         last_mem_write_of = defaultdict(list)
@@ -466,16 +465,17 @@ class Merger:
 
         def read(reg, n):
             for dup in reg.duplicates:
-                if last_def[dup] not in (-1, n):
-                    add_edge(last_def[dup], n)
-            last_read[reg].append(n)
+                last = last_def.get(id(dup), -1)
+                if last not in (-1, n):
+                    add_edge(last, n)
+            last_read[id(reg)].append(n)
 
         def write(reg, n):
             for dup in reg.duplicates:
-                add_edge(last_def[dup], n)
-                for m in last_read[dup]:
+                add_edge(last_def.get(id(dup), -1), n)
+                for m in last_read.get(id(dup), ()):
                     add_edge(m, n)
-            last_def[reg] = n
+            last_def[id(reg)] = n
 
         def handle_mem_access(addr, reg_type, last_access_this_kind,
                               last_access_other_kind):
@@ -557,8 +557,6 @@ class Merger:
         for n,instr in enumerate(block.instructions):
             outputs,inputs = instr.get_def(), instr.get_used()
 
-            G.add_node(n)
-
             # if options.debug:
             #     col = colordict[instr.__class__.__name__]
             #     G.add_node(n, color=col, label=str(instr))
@@ -703,7 +701,7 @@ class Merger:
                 for i_inst in shuffles[instr.args[0]]:
                     add_edge(i_inst, n)
 
-            if not G.pred[n]:
+            if not G.in_degree(n):
                 self.sources.append(n)
 
             if n % 1000000 == 0 and n > 0:
@@ -713,12 +711,12 @@ class Merger:
     def merge_nodes(self, i, j):
         """ Merge node j into i, removing node j """
         G = self.G
-        if j in G[i]:
+        if G.has_edge(i, j):
             G.remove_edge(i, j)
-        if i in G[j]:
+        if G.has_edge(j, i):
             G.remove_edge(j, i)
-        G.add_edges_from(list(zip(itertools.cycle([i]), G[j], [G.weights[(j,k)] for k in G[j]])))
-        G.add_edges_from(list(zip(G.pred[j], itertools.cycle([i]), [G.weights[(k,j)] for k in G.pred[j]])))
+        G.add_edges_from(zip(itertools.cycle([i]), G[j]))
+        G.add_edges_from(zip(G.pred[j], itertools.cycle([i])))
         G.get_attr(i, 'merges').append(j)
         G.remove_node(j)
 
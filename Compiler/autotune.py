@@ -0,0 +1,153 @@
+"""
+This module chooses how far :py:func:`~Compiler.library.for_range_opt`
+and similar unroll a loop. By default, loop bodies are unrolled until
+the basic block reaches the budget (``--budget``) regardless of the
+loop. With ``--autotune``, the compiler instead measures the first
+iteration of every such loop, that is, the number of instructions, the
+number of communication rounds as found by
+:py:class:`~Compiler.allocator.Merger`, and the number of registers
+defined, and it chooses the number of unrolled iterations per loop
+from the following targets:
+
+- ``rounds=N``: unroll just enough for the loop to take at most *N*
+  rounds, assuming that the iterations are independent. This only
+  applies to loops with a compile-time number of iterations.
+- ``instructions=N``: unroll up to *N* instructions per basic block,
+  which bounds the compilation time and memory. This defaults to the
+  budget.
+- ``registers=N``: unroll up to *N* registers defined per basic block,
+  which bounds the memory usage of the virtual machine.
+
+Targets are separated by commas, for example ``--autotune
+rounds=100,registers=1000000``. The upper limits take precedence over
+the rounds target, and the choices are listed at the end of the
+compilation.
+"""
+
+import os
+import traceback
+import types
+
+from . import util
+from .exceptions import CompilerError
+
+TARGETS = 'rounds', 'instructions', 'registers'
+
+
+def loop_location():
+    """Source location of the innermost frame outside the compiler."""
+    compiler_dir = os.path.dirname(os.path.abspath(__file__))
+    for frame in reversed(traceback.extract_stack()):
+        if os.path.dirname(os.path.abspath(frame.filename)) != compiler_dir:
+            return '%s:%d' % (os.path.basename(frame.filename), frame.lineno)
+    return '?'
+
+
+def count_rounds(instructions, program):
+    """Number of communication rounds of a list of instructions after
+    merging, without changing the instructions."""
+    from .allocator import Merger
+    block = types.SimpleNamespace(instructions=list(instructions),
+                                  warn_about_mem=False, parent=None)
+    merger = Merger(block, program.options, tuple(program.to_merge))
+    return len(set(merger.depths[node] for node in merger.open_nodes))
+
+
+def min_unroll(n_loops, n_rounds, max_rounds):
+    """Smallest number of unrolled iterations such that ``n_loops``
+    iterations of ``n_rounds`` rounds each take at most ``max_rounds``
+    rounds, that is, ``ceil(n_loops / unroll) * n_rounds <=
+    max_rounds``. Returns ``n_loops`` if the target cannot be met."""
+    max_blocks = max_rounds // n_rounds
+    if max_blocks == 0:
+        return n_loops
+    return -(-n_loops // max_blocks)
+
+
+class UnrollChoice:
+    __slots__ = ('location', 'n_loops', 'instructions', 'rounds',
+                 'registers', 'unroll', 'limit')
+
+    def __init__(self, location, n_loops, instructions, rounds, registers,
+                 unroll, limit):
+        self.location = location
+        self.n_loops = n_loops
+        self.instructions = instructions
+        self.rounds = rounds
+        self.registers = registers
+        self.unroll = unroll
+        self.limit = limit
+
+    def total_rounds(self):
+        if self.n_loops is None:
+            return None
+        return -(-self.n_loops // self.unroll) * self.rounds
+
+
+class UnrollTuner:
+    """Chooses the unrolling per loop.
+
+    :param spec: comma-separated targets such as ``rounds=100``
+    """
+
+    def __init__(self, spec):
+        self.targets = {}
+        for part in spec.split(','):
+            name, _, value = part.strip().partition('=')
+            if name not in TARGETS or not value.isdigit() or \
+               int(value) <= 0:
+                raise CompilerError(
+                    'invalid autotuning target "%s", use one or more of '
+                    '%s with a positive number (e.g., rounds=100)' %
+                    (part, ', '.join(TARGETS)))
+            self.targets[name] = int(value)
+        self.choices = []
+
+    def choose(self, instructions, n_loops, budget, program):
+        """Number of iterations to unroll given the instructions of the
+        first iteration.
+
+        :param instructions: instructions of the first iteration
+        :param n_loops: number of iterations (int or run-time)
+        :param budget: default instruction limit per basic block
+        """
+        n_instructions = max(1, len(instructions))
+        n_registers = max(1, sum(reg.size for inst in instructions
+                                 for reg in inst.get_def()))
+        n_rounds = count_rounds(instructions, program)
+        limits = {}
+        limits['instructions'] = self.targets.get('instructions', budget) \
+            // n_instructions
+        if 'registers' in self.targets:
+            limits['registers'] = self.targets['registers'] // n_registers
+        limit = min(limits, key=limits.get)
+        unroll = limits[limit]
+        if util.is_constant(n_loops):
+            if 'rounds' in self.targets and n_rounds:
+                needed = min_unroll(n_loops, n_rounds,
+                                    self.targets['rounds'])
+                if needed < unroll:
+                    unroll, limit = needed, 'rounds'
+            if n_loops <= unroll:
+                unroll, limit = n_loops, 'iterations'
+        else:
+            n_loops = None
+        unroll = max(1, unroll)
+        self.choices.append(UnrollChoice(
+            loop_location(), n_loops, len(instructions), n_rounds,
+            n_registers, unroll, limit))
+        return unroll
+
+    def table(self):
+        """Report of the choices as human-readable table."""
+        lines = ['%-24s %10s %8s %8s %10s %7s %8s  %s' % (
+            'Loop', 'Iterations', 'Instr.', 'Rounds', 'Registers',
+            'Unroll', 'Rounds', 'Limited by')]
+        for x in self.choices:
+            lines.append('%-24s %10s %8d %8d %10d %7d %8s  %s' % (
+                x.location, '?' if x.n_loops is None else x.n_loops,
+                x.instructions, x.rounds, x.registers, x.unroll,
+                '?' if x.n_loops is None else x.total_rounds(), x.limit))
+        lines.append('Instructions, rounds, and registers per iteration, '
+                     'estimated rounds per loop execution')
+        return '\n'.join(lines)
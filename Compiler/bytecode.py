@@ -0,0 +1,305 @@
+"""
+This module implements fast decoding of bytecode files as written by
+:py:func:`Compiler.program.Tape.write_bytes`. Files are memory-mapped,
+and instructions are decoded with one precompiled
+:py:class:`struct.Struct` per opcode and number of arguments instead of
+one read per argument. :py:func:`read_raw` yields plain tuples for
+analysis, and :py:func:`read` yields
+:py:class:`~Compiler.instructions_base.ParsedInstruction` as used by
+:py:func:`Compiler.program.Tape.read_instructions`. In the other
+direction, :py:func:`write` packs instructions into a reusable buffer
+with one struct per instruction class and number of arguments.
+"""
+
+import itertools
+import mmap
+import os
+import struct
+
+from Compiler import instructions_base as base
+
+header = struct.Struct('>Q')
+int_struct = struct.Struct('>i')
+
+
+def struct_code(format_str):
+    """Struct code of an argument format or None if the length
+    depends on the content."""
+    t = base.ArgFormats[format_str]
+    if t.is_reg:
+        return 'I'
+    elif issubclass(t, base.LongArgFormat):
+        return 'q'
+    elif issubclass(t, base.IntArgFormat):
+        return 'i'
+    elif issubclass(t, base.String):
+        return '%ds' % t.length
+    else:
+        return None
+
+
+def decode_string(value):
+    return str(value.partition(b'\0')[0], 'ascii')
+
+
+class Layout:
+    """Decoding information for an opcode. Structs are compiled
+    lazily per number of arguments."""
+
+    def __init__(self, type):
+        self.type = type
+        self.name = type.__name__
+        try:
+            self.n_args = len(type.arg_format)
+            self.var_args = False
+        except:
+            self.n_args = None
+            self.var_args = True
+        self.dynamic = False
+        try:
+            iter(type.arg_format)
+        except:
+            self.dynamic = self.name != 'cisc'
+        self.structs = {}
+
+    def arg_formats(self):
+        if self.name == 'cisc':
+            return itertools.chain(['str'], itertools.repeat('int'))
+        else:
+            return iter(self.type.arg_format)
+
+    def get_struct(self, n_args):
+        """:returns: struct, formats, and indices of string arguments,
+        or None if the layout depends on the content"""
+        try:
+            return self.structs[n_args]
+        except KeyError:
+            pass
+        if self.dynamic:
+            res = None
+        else:
+            formats = tuple(itertools.islice(self.arg_formats(), n_args))
+            codes = [struct_code(f) for f in formats]
+            if None in codes:
+                res = None
+            else:
+                strings = tuple(i for i, f in enumerate(formats)
+                                if base.ArgFormats[f] is base.String)
+                res = struct.Struct('>' + ''.join(codes)), formats, strings
+        self.structs[n_args] = res
+        return res
+
+    def decode_generic(self, buf, offset, n_args):
+        """Decode one argument at a time for formats depending on
+        earlier arguments."""
+        args = []
+        def arg_iter():
+            for arg in itertools.count():
+                value = args[arg]
+                yield None if isinstance(value, str) else value
+        if self.dynamic:
+            arg_format = self.type.dynamic_arg_format(arg_iter())
+        else:
+            arg_format = self.arg_formats()
+        formats = []
+        for i in range(n_args):
+            f = next(arg_format)
+            formats.append(f)
+            code = struct_code(f)
+            if code is None:
+                length = int_struct.unpack_from(buf, offset)[0]
+                offset += 4
+                args.append(str(buf[offset:offset + length], 'ascii'))
+                offset += length
+            else:
+                value = struct.unpack_from('>' + code, buf, offset)[0]
+                offset += struct.calcsize(code)
+                if code[-1] == 's':
+                    value = decode_string(value)
+                args.append(value)
+        return tuple(args), tuple(formats), offset
+
+
+_layouts = {}
+
+
+def layouts():
+    """Decoding information indexed by opcode. This is built once per
+    process from the instruction classes."""
+    if not _layouts:
+        base.ParsedInstruction.init_reverse_opcodes()
+        for code, t in base.ParsedInstruction.reverse_opcodes.items():
+            _layouts[code] = Layout(t)
+    return _layouts
+
+
+def decode(buf, offset=0):
+    """Decode a buffer of bytecode.
+
+    :param offset: byte offset to start at (must be the start of an
+      instruction)
+    :returns: iterator of tuples (layout, vector size, argument values,
+      argument formats, byte offset of the next instruction)"""
+    table = layouts()
+    code_length = base.Instruction.code_length
+    mask = (1 << code_length) - 1
+    unpack_header = header.unpack_from
+    unpack_int = int_struct.unpack_from
+    end = len(buf)
+    while offset < end:
+        full_code = unpack_header(buf, offset)[0]
+        offset += 8
+        layout = table[full_code & mask]
+        if layout.var_args:
+            n_args = unpack_int(buf, offset)[0]
+            offset += 4
+        else:
+            n_args = layout.n_args
+        compiled = layout.structs.get(n_args, False)
+        if compiled is False:
+            compiled = layout.get_struct(n_args)
+        if compiled is None:
+            args, formats, offset = layout.decode_generic(buf, offset, n_args)
+        else:
+            s, formats, strings = compiled
+            args = s.unpack_from(buf, offset)
+            offset += s.size
+            if strings:
+                args = list(args)
+                for i in strings:
+                    args[i] = decode_string(args[i])
+                args = tuple(args)
+        yield layout, full_code >> code_length, args, formats, offset
+
+
+def mapped(filename):
+    """Read-only memory map of a file, or an empty buffer."""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            return b''
+
+
+def read_raw(filename):
+    """Decode a bytecode file into lightweight tuples.
+
+    :returns: iterator of tuples (instruction class, vector size,
+      argument values, argument formats), where values are integers or
+      strings and formats are keys of
+      :py:obj:`~Compiler.instructions_base.ArgFormats`"""
+    for layout, size, args, formats, _ in decode(mapped(filename)):
+        yield layout.type, size, args, formats
+
+
+def read(filename):
+    """Decode a bytecode file.
+
+    :returns: iterator of
+      :py:class:`~Compiler.instructions_base.ParsedInstruction`"""
+    create = base.ParsedInstruction.from_values
+    for layout, size, args, formats, _ in decode(mapped(filename)):
+        yield create(layout.type, size, args, formats, layout.var_args)
+
+
+buffer_size = 1 << 20
+
+_encoders = {}
+
+
+def encoder(instruction):
+    """Encoding information for the class and number of arguments of
+    an instruction.
+
+    :returns: struct covering the code and all arguments, indicators
+      which arguments are registers (None if all are), indices of
+      string arguments, and whether the number of arguments is
+      encoded, or None if the
+      instruction has to be encoded by
+      :py:func:`~Compiler.instructions_base.Instruction.get_bytes`"""
+    t = type(instruction)
+    if t.get_bytes is not base.Instruction.get_bytes or \
+       t.get_encoding is not base.Instruction.get_encoding:
+        return None
+    compiled = Layout(t).get_struct(len(instruction.args))
+    if compiled is None:
+        return None
+    s, formats, strings = compiled
+    var_args = instruction.has_var_args()
+    regs = tuple(base.ArgFormats[f].is_reg for f in formats)
+    if all(regs):
+        regs = None
+    code = '>q' + 'i' * var_args + s.format.lstrip('>')
+    return struct.Struct(code), regs, strings, var_args
+
+
+def encode_args(args, regs, strings):
+    values = [arg.i if reg else arg for arg, reg in zip(args, regs)]
+    for i in strings:
+        value = bytes(values[i], 'ascii')
+        if len(value) > base.String.length or b'\0' in value:
+            raise ValueError('invalid string')
+        values[i] = value
+    return values
+
+
+def write(instructions, f, h):
+    """Write the encoding of instructions to a file. The output is
+    identical to concatenating
+    :py:func:`~Compiler.instructions_base.Instruction.get_bytes`,
+    which remains in use for instructions with special or
+    content-dependent encoding and for arguments that the structs
+    reject (leading to the usual errors).
+
+    :param instructions: iterable of instructions, skipping None
+    :param f: file opened in binary mode
+    :param h: hash object to update with the output
+    """
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    offset = 0
+    cache = _encoders
+
+    def flush(end):
+        chunk = view[:end]
+        f.write(chunk)
+        h.update(chunk)
+
+    for i in instructions:
+        if i is None:
+            continue
+        args = i.args
+        key = type(i), len(args)
+        enc = cache.get(key, False)
+        if enc is False:
+            enc = cache[key] = encoder(i)
+        if enc is not None:
+            s, regs, strings, var_args = enc
+            if offset + s.size > buffer_size:
+                flush(offset)
+                offset = 0
+            try:
+                if regs is None:
+                    values = [arg.i for arg in args]
+                else:
+                    values = encode_args(args, regs, strings)
+                if var_args:
+                    s.pack_into(buf, offset, i.get_code(), len(args), *values)
+                else:
+                    s.pack_into(buf, offset, i.get_code(), *values)
+                offset += s.size
+                continue
+            except (struct.error, AttributeError, TypeError, ValueError):
+                pass
+        b = i.get_bytes()
+        if offset + len(b) > buffer_size:
+            flush(offset)
+            offset = 0
+            if len(b) > buffer_size:
+                f.write(b)
+                h.update(b)
+                continue
+        buf[offset:offset + len(b)] = b
+        offset += len(b)
+    flush(offset)
+    view.release()
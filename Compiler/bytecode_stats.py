@@ -0,0 +1,348 @@
+"""
+This module computes statistics of compiled programs from the bytecode
+alone, without recompiling. Each tape is decoded once with
+:py:func:`Compiler.bytecode.decode`, and the following is collected per
+tape and per basic block:
+
+- instruction histogram
+- communication rounds, counting one per instruction of a class that
+  the compiler merges (see
+  :py:func:`Compiler.program.Program.default_merge_classes`)
+- opened elements and estimated communication in elements, assuming
+  two openings per multiplication as with Beaver triples
+- preprocessing consumed by the instructions in the block
+- the total preprocessing as declared to the virtual machine
+  (:py:func:`~Compiler.instructions_base.ParsedInstruction.get_usage`),
+  and the memory and register footprint (per tape only)
+
+All numbers are static, that is, instructions in loops are counted
+once. Basic blocks are split after jumps and at jump targets. Blocks
+containing the target of a later backward jump are split by decoding
+their first part again.
+
+Results are cached as JSON by the hash of the bytecode file, see
+:py:class:`StatsCache`. ``Scripts/bytecode-stats.py`` presents the
+results, and ``Scripts/memory-usage.py`` and ``Scripts/prep-usage.py``
+show parts of them.
+"""
+
+import bisect
+import collections
+import hashlib
+import json
+import operator
+import os
+
+from Compiler import bytecode
+from Compiler import instructions_base as base
+
+VERSION = 1
+
+
+def requirements_to_json(reqs):
+    """List of pairs (requirement, number) where nested tuples in
+    requirements such as ``('matmul', (2, 3, 4))`` become lists."""
+    return [[[list(x) if isinstance(x, tuple) else x for x in req], n]
+            for req, n in reqs.items()]
+
+
+def requirements_from_json(items):
+    """:py:class:`~Compiler.program.Tape.ReqNum` from the output of
+    :py:func:`requirements_to_json`."""
+    from Compiler.program import Tape
+
+    res = Tape.ReqNum()
+    for req, n in items:
+        res[tuple(tuple(x) if isinstance(x, list) else x
+                  for x in req)] += n
+    return res
+
+
+class ClassInfo:
+    """Properties of an instruction class relevant for statistics."""
+
+    def __init__(self, t, merge_classes):
+        self.name = t.__name__
+        self.jump_arg = None
+        self.is_jump = issubclass(t, base.JumpInstruction)
+        if self.is_jump and t.arg_format[t.jump_arg] != 'ci':
+            self.jump_arg = t.jump_arg
+        self.is_round = issubclass(t, merge_classes) and \
+            not issubclass(t, base.MemoryInstruction)
+        self.data = None
+        # shuffles are data instructions with their own accounting
+        if issubclass(t, base.DataInstruction) and hasattr(t, 'data_type'):
+            self.data = t.field_type, t.data_type
+            self.instance = t.__new__(t)
+            self.get_repeat = t.get_repeat
+        self.has_usage = getattr(t, 'get_usage', base.Instruction.get_usage) \
+            is not base.Instruction.get_usage
+        self.is_direct_memory = issubclass(t, base.DirectMemoryInstruction)
+
+    def repeat(self, args):
+        self.instance.args = args
+        return self.get_repeat(self.instance)
+
+
+class BlockStats:
+    """Statistics of a basic block. All of them are additive."""
+
+    def __init__(self, start, offset):
+        self.start = start
+        self.offset = offset
+        self.n_instructions = 0
+        self.histogram = collections.Counter()
+        self.rounds = 0
+        self.opens = 0
+        self.communication = 0
+        self.prep = collections.Counter()
+        self.jump = None
+
+    def add(self, info, size, args):
+        self.n_instructions += 1
+        self.histogram[info.name] += 1
+        if info.is_round:
+            self.rounds += 1
+        if info.data:
+            n = max(size, 1) * info.repeat(args)
+            if info.data[1] == 'open':
+                self.opens += n
+                self.communication += n
+            else:
+                self.prep[info.data] += n
+                if info.is_round and info.data[1] == 'triple':
+                    self.communication += 2 * n
+
+    def update(self, other, sign=1):
+        """Add (or subtract) the statistics of another block."""
+        self.n_instructions += sign * other.n_instructions
+        self.rounds += sign * other.rounds
+        self.opens += sign * other.opens
+        self.communication += sign * other.communication
+        if sign > 0:
+            self.histogram.update(other.histogram)
+            self.prep.update(other.prep)
+        else:
+            self.histogram = self.histogram - other.histogram
+            self.prep = self.prep - other.prep
+
+    def to_json(self):
+        return dict(start=self.start, instructions=self.n_instructions,
+                    jump=self.jump, rounds=self.rounds, opens=self.opens,
+                    communication=self.communication,
+                    prep=requirements_to_json(self.prep),
+                    histogram=dict(self.histogram.most_common()))
+
+
+class TapeStats:
+    """Statistics of a bytecode file.
+
+    :param filename: path of the ``.bc`` file
+    """
+
+    _classes = {}
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.buf = bytecode.mapped(filename)
+        self.hash = hashlib.sha256(self.buf).hexdigest()
+        self.blocks = []
+        # start of each block for bisection
+        self.starts = []
+        self.usage = collections.Counter()
+        self.memory = collections.Counter()
+        self.registers = {}
+        self.formats = {}
+
+    @classmethod
+    def info(cls, t):
+        try:
+            return cls._classes[t]
+        except KeyError:
+            from Compiler.program import Program
+            merge_classes = tuple(Program.default_merge_classes())
+            res = cls._classes[t] = ClassInfo(t, merge_classes)
+            return res
+
+    def register_groups(self, formats):
+        """Register arguments by register type as tuples (type, index or
+        item getter, whether there are several)."""
+        try:
+            return self.formats[formats]
+        except KeyError:
+            groups = collections.defaultdict(list)
+            for i, f in enumerate(formats):
+                t = base.ArgFormats[f]
+                if t.is_reg:
+                    groups[t.name].append(i)
+            res = []
+            for name, indices in groups.items():
+                self.registers.setdefault(name, 0)
+                if len(indices) == 1:
+                    res.append((name, indices[0], False))
+                else:
+                    res.append((name, operator.itemgetter(*indices), True))
+            res = self.formats[formats] = tuple(res)
+            return res
+
+    def new_block(self, start, offset):
+        block = BlockStats(start, offset)
+        self.blocks.append(block)
+        self.starts.append(start)
+        return block
+
+    def split(self, target):
+        """Split the block containing an instruction index."""
+        i = bisect.bisect_right(self.starts, target) - 1
+        block = self.blocks[i]
+        if block.start == target:
+            return
+        first = BlockStats(block.start, block.offset)
+        offset = block.offset
+        decoded = bytecode.decode(self.buf, offset)
+        for _ in range(target - block.start):
+            layout, size, args, formats, offset = next(decoded)
+            first.add(self.info(layout.type), size, args)
+        block.update(first, -1)
+        block.start = target
+        block.offset = offset
+        self.blocks.insert(i, first)
+        self.starts.insert(i + 1, target)
+
+    def run(self):
+        info = self.info
+        register_groups = self.register_groups
+        memory = self.memory
+        registers = self.registers
+        targets = set()
+        block = self.new_block(0, 0)
+        i = 0
+        for layout, size, args, formats, offset in bytecode.decode(self.buf):
+            if i in targets and block.n_instructions:
+                block = self.new_block(i, block_offset)
+            t = info(layout.type)
+            block.add(t, size, args)
+            vsize = max(size, 1)
+            for name, index, several in register_groups(formats):
+                value = (max(index(args)) if several else args[index]) + vsize
+                if value > registers[name]:
+                    registers[name] = value
+            if t.is_direct_memory:
+                mem_type = base.ArgFormats[formats[0]].name
+                memory[mem_type] = max(memory[mem_type], args[1] + vsize)
+            if t.has_usage:
+                inst = base.ParsedInstruction.from_values(
+                    layout.type, size, args, formats, layout.var_args)
+                self.usage.update(inst.get_usage())
+            i += 1
+            block_offset = offset
+            if t.is_jump:
+                if t.jump_arg is not None:
+                    target = i + args[t.jump_arg]
+                    block.jump = target
+                    if target >= i:
+                        targets.add(target)
+                    elif target >= 0:
+                        self.split(target)
+                block = self.new_block(i, offset)
+        if not self.blocks[-1].n_instructions:
+            self.blocks.pop()
+            self.starts.pop()
+        del self.buf
+        return self
+
+    def to_json(self):
+        total = BlockStats(0, 0)
+        for block in self.blocks:
+            total.update(block)
+        res = total.to_json()
+        del res['start'], res['jump']
+        res.update(
+            hash=self.hash, version=VERSION,
+            usage=requirements_to_json(self.usage),
+            memory=dict(self.memory), registers=dict(self.registers),
+            blocks=[block.to_json() for block in self.blocks])
+        return res
+
+
+class StatsCache:
+    """On-disk cache of tape statistics in JSON keyed by the hash of
+    the bytecode.
+
+    :param directory: cache directory (created if necessary)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, digest):
+        return os.path.join(self.directory, '%s.json' % digest)
+
+    def load(self, digest):
+        try:
+            with open(self.path(digest)) as f:
+                res = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if res.get('version') == VERSION:
+            return res
+
+    def store(self, res):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path(res['hash']) + '.%d.tmp' % os.getpid()
+        with open(tmp, 'w') as f:
+            json.dump(res, f)
+        os.replace(tmp, self.path(res['hash']))
+
+
+def file_hash(filename):
+    return hashlib.sha256(bytecode.mapped(filename)).hexdigest()
+
+
+def tape_stats(filename, cache=None):
+    """Statistics of a bytecode file as JSON-compatible dictionary.
+
+    :param cache: :py:class:`StatsCache` or None
+    """
+    if cache:
+        res = cache.load(file_hash(filename))
+        if res is not None:
+            return res
+    res = TapeStats(filename).run().to_json()
+    if cache:
+        cache.store(res)
+    return res
+
+
+def program_stats(program, cache=None):
+    """Statistics of all tapes of a compiled program and the
+    estimated memory usage.
+
+    :param program: program name with arguments as in
+      ``Programs/Schedules``
+    :param cache: :py:class:`StatsCache` or None
+    """
+    from Compiler.program import Program
+
+    tapes = []
+    for tapename in Program.read_tapes(program):
+        res = tape_stats('Programs/Bytecode/%s.bc' % tapename, cache)
+        res['name'] = tapename
+        tapes.append(res)
+    n_threads = Program.read_n_threads(program)
+    domain_size = Program.read_domain_size(program) or 8
+    memory = collections.Counter()
+    thread_registers = collections.Counter()
+    for tape in tapes:
+        memory |= collections.Counter(tape['memory'])
+    for tape in tapes[1:]:
+        thread_registers |= collections.Counter(tape['registers'])
+    total = sum(memory.values()) + sum(tapes[0]['registers'].values())
+    thread_total = sum(thread_registers.values())
+    return dict(
+        program=program, n_threads=n_threads, domain_size=domain_size,
+        memory=dict(memory), registers=tapes[0]['registers'],
+        thread_registers=dict(thread_registers),
+        min_ram=domain_size * (total + thread_total),
+        max_ram=3 * domain_size * (total + (n_threads - 1) * thread_total),
+        tapes=tapes)
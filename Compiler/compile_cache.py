@@ -0,0 +1,580 @@
+"""
+This module implements a persistent on-disk cache for compiled programs.
+An entry is keyed on everything that influences the output of the
+compiler: the source file or the function to compile (including the
+values it captures and the globals it refers to), the parsed options,
+the program arguments, the source of the compiler itself, and
+global state such as the fixed-point precision. On a hit, the bytecode
+and schedule files are restored instead of compiling again. Python
+modules outside the compiler might be imported by the program, so an
+entry also records the hashes of all such modules loaded at the time
+of compilation, and it is only used if they are unchanged.
+
+The cache is enabled with ``--cache DIR`` or by setting the environment
+variable ``MP_SPDZ_COMPILE_CACHE`` to a directory.
+
+Independently, the instruction templates of mergeable CISC instructions
+(comparisons, truncation, fixed-point division etc.) can be kept on disk
+with ``--template-cache DIR`` or ``MP_SPDZ_TEMPLATE_CACHE``. This speeds
+up the compilation of programs that are not in the compilation cache.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import sys
+import sysconfig
+import tempfile
+import types
+
+CACHE_ENV = "MP_SPDZ_COMPILE_CACHE"
+TEMPLATE_CACHE_ENV = "MP_SPDZ_TEMPLATE_CACHE"
+DEFAULT_MAX_SIZE = 1024
+
+# options that do not change the output
+IGNORED_OPTIONS = ("cache_dir", "cache_size", "template_cache", "jobs",
+                   "profile", "profile_phases", "profile_json",
+                   "profile_memory", "verbose")
+
+
+class Uncacheable(Exception):
+    """Raised if the input contains state that cannot be fingerprinted
+    reliably."""
+    pass
+
+
+_file_hashes = {}
+
+
+def file_hash(filename):
+    stat = os.stat(filename)
+    key = filename, stat.st_mtime_ns, stat.st_size
+    if key not in _file_hashes:
+        with open(filename, "rb") as f:
+            _file_hashes[key] = hashlib.sha256(f.read()).hexdigest()
+    return _file_hashes[key]
+
+
+def compiler_version():
+    """Hash of all Python files of the compiler package."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    for dirpath, dirnames, filenames in sorted(os.walk(root)):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                path = os.path.join(dirpath, filename)
+                h.update(os.path.relpath(path, root).encode())
+                h.update(file_hash(path).encode())
+    return h.hexdigest()
+
+
+def user_modules():
+    """Hashes of the files of all loaded Python modules except the
+    compiler, the standard library, and installed packages. These
+    might have been imported by the program, so a cache entry is only
+    valid if they are unchanged."""
+    compiler_root = os.path.dirname(os.path.abspath(__file__))
+    paths = sysconfig.get_paths()
+    excluded = [compiler_root] + [
+        os.path.abspath(paths[x]) for x in
+        ("stdlib", "platstdlib", "purelib", "platlib") if x in paths]
+    res = {}
+    for module in list(sys.modules.values()):
+        filename = getattr(module, "__file__", None)
+        if not filename:
+            continue
+        filename = os.path.abspath(filename)
+        if any(filename.startswith(x + os.sep) for x in excluded) or \
+           not os.path.exists(filename):
+            continue
+        res[filename] = file_hash(filename)
+    return res
+
+
+def modules_unchanged(modules):
+    """Whether module files still have the hashes returned by
+    :py:func:`user_modules`."""
+    for filename, digest in modules.items():
+        try:
+            if file_hash(filename) != digest:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def global_state():
+    """Global settings that are commonly changed before compilation."""
+    from . import types as compiler_types
+
+    res = []
+    for t in compiler_types.sfix, compiler_types.cfix:
+        res.append((t.__name__, t.f, t.k, getattr(t, "round_nearest", None)))
+    res.append(("sfloat", compiler_types.sfloat.vlen,
+                compiler_types.sfloat.plen))
+    res.append(("PLAYERS", os.getenv("PLAYERS")))
+    return repr(res)
+
+
+def program_state(program):
+    """Settings of a program that influence non-linear functionality."""
+    from . import instructions_base
+
+    options = program.options
+    res = [(x, getattr(options, x, None))
+           for x in ("ring", "field", "prime", "binary", "galois",
+                     "max_parallel_open")]
+    res.append(type(program.non_linear).__name__)
+    res += [program.bit_length, program.prime, program.use_dabit,
+            program._use_trunc_pr, program._edabit, program._invperm,
+            program._split, program._square, program._always_raw,
+            program._linear_rounds, program._always_active,
+            program._active,
+            instructions_base.get_global_instruction_type()]
+    return repr(res)
+
+
+class Fingerprint:
+    """Structural hash of Python objects, in particular functions
+    including the values they capture and the globals they refer to.
+    Objects without a stable representation raise :py:class:`Uncacheable`.
+    """
+
+    compiler_root = os.path.dirname(os.path.abspath(__file__))
+
+    def __init__(self):
+        self.h = hashlib.sha256()
+        self.seen = set()
+
+    def update(self, *args):
+        for arg in args:
+            self.h.update(str(arg).encode())
+            self.h.update(b"\0")
+
+    def hexdigest(self):
+        return self.h.hexdigest()
+
+    def add(self, obj):
+        if obj is None or isinstance(obj, (bool, int, float, complex, str,
+                                           bytes)):
+            self.update(type(obj).__name__, repr(obj))
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            items = list(obj)
+            if isinstance(obj, (set, frozenset)):
+                items = sorted(items, key=repr)
+            self.update(type(obj).__name__, len(items))
+            for item in items:
+                self.add(item)
+        elif isinstance(obj, dict):
+            self.update("dict", len(obj))
+            for key in sorted(obj, key=repr):
+                self.add(key)
+                self.add(obj[key])
+        elif isinstance(obj, types.ModuleType):
+            self.add_module(obj)
+        elif isinstance(obj, (types.FunctionType, types.MethodType)):
+            self.add_function(obj)
+        elif isinstance(obj, types.CodeType):
+            self.add_code(obj)
+        elif isinstance(obj, type):
+            self.update("class", obj.__module__, obj.__qualname__)
+            module = sys.modules.get(obj.__module__)
+            if module is not None:
+                self.add_module(module)
+        elif isinstance(obj, types.BuiltinFunctionType):
+            self.update("builtin", obj.__module__, obj.__qualname__)
+        elif dataclasses.is_dataclass(obj):
+            self.update("dataclass", type(obj).__qualname__)
+            self.add(type(obj))
+            self.add(dataclasses.asdict(obj))
+        else:
+            representation = repr(obj)
+            if " at 0x" in representation:
+                raise Uncacheable(representation)
+            self.update(type(obj).__qualname__, representation)
+
+    def add_module(self, module):
+        filename = getattr(module, "__file__", None)
+        self.update("module", module.__name__)
+        if filename and os.path.exists(filename) and \
+           not os.path.abspath(filename).startswith(self.compiler_root):
+            self.update(file_hash(filename))
+
+    def add_code(self, code):
+        self.update("code", code.co_code, code.co_names, code.co_varnames,
+                    code.co_freevars)
+        for const in code.co_consts:
+            self.add(const)
+
+    def add_function(self, function):
+        if isinstance(function, types.MethodType):
+            self.add(function.__self__)
+            function = function.__func__
+        self.update("function", function.__module__, function.__qualname__)
+        if id(function) in self.seen:
+            return
+        self.seen.add(id(function))
+        module = function.__module__ or ""
+        if module == "Compiler" or module.startswith("Compiler."):
+            # covered by the compiler version
+            return
+        self.add_code(function.__code__)
+        self.add(function.__defaults__)
+        self.add(function.__kwdefaults__)
+        for cell in function.__closure__ or ():
+            try:
+                self.add(cell.cell_contents)
+            except ValueError:
+                self.update("empty cell")
+        for name in sorted(self.global_names(function.__code__)):
+            if name in function.__globals__:
+                self.update("global", name)
+                self.add(function.__globals__[name])
+
+    @classmethod
+    def global_names(cls, code):
+        res = set(code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                res |= cls.global_names(const)
+        return res
+
+
+class CompileCache:
+    """Content-addressed cache of compiled programs with a size limit and
+    least-recently-used eviction.
+
+    :param directory: where to store the entries
+    :param max_size: size limit in MB
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size * 2 ** 20
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(options, args, source):
+        """Compute the cache key.
+
+        :param options: parsed compiler options
+        :param args: program arguments
+        :param source: source (str/bytes) or function to compile
+        :raises: :py:class:`Uncacheable`
+        """
+        fingerprint = Fingerprint()
+        fingerprint.update(compiler_version(), global_state())
+        fingerprint.add({key: value for key, value in vars(options).items()
+                         if key not in IGNORED_OPTIONS})
+        fingerprint.add(list(args))
+        fingerprint.add(source)
+        return fingerprint.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def restore(self, key):
+        """Restore the files of an entry.
+
+        :returns: metadata of the entry or None if missing
+        """
+        entry = self.entry(key)
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if "modules" not in meta or not modules_unchanged(meta["modules"]):
+            # imported modules changed, remove for the new entry
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        for filename in meta["files"]:
+            dirname = os.path.dirname(filename)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            shutil.copyfile(os.path.join(entry, "files", filename), filename)
+        os.utime(entry)
+        return meta
+
+    def store(self, key, filenames, summary):
+        """Store files as a new entry and evict old entries if necessary.
+
+        :param filenames: relative paths of output files
+        :param summary: output lines to repeat on a hit
+        """
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            for filename in filenames:
+                dest = os.path.join(tmp, "files", filename)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.copyfile(filename, dest)
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"files": filenames, "summary": summary,
+                       "modules": user_modules()}, f)
+            try:
+                os.rename(tmp, self.entry(key))
+            except OSError:
+                # stored concurrently
+                shutil.rmtree(tmp)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict()
+
+    @staticmethod
+    def entry_size(path):
+        size = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+        return size
+
+    def evict(self):
+        """Remove least recently used entries until below the size limit."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith("."):
+                continue
+            path = self.entry(name)
+            entries.append((os.path.getmtime(path), self.entry_size(path),
+                            path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+class TemplateCache:
+    """On-disk cache of the instruction templates of mergeable CISC
+    instructions (see :py:func:`Compiler.instructions_base.cisc`). An
+    entry is keyed on the merge id (function, parameters, and security
+    parameter), the ring/field settings of the program, and the
+    compiler version.
+
+    Templates are stored as JSON: registers are replaced by indices and
+    instructions by their class name and state. Loading only creates
+    instructions of compiler classes with constant and register
+    arguments, so entries cannot run code. Templates that refer to
+    registers from outside the template or to registers of binary types
+    raise :py:class:`Uncacheable` and are only kept in memory.
+
+    :param directory: where to store the entries
+    """
+
+    CONSTANTS = (type(None), bool, int, float, str)
+    VERSION = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.version = compiler_version()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, program, merge_id):
+        """Compute the key of a template.
+
+        :raises: :py:class:`Uncacheable`
+        """
+        function = merge_id[0]
+        fingerprint = Fingerprint()
+        fingerprint.update(self.version, global_state(),
+                           program_state(program), function.__name__)
+        # distinguish wrappers such as ret_cisc
+        for cell in function.__closure__ or ():
+            fingerprint.add(cell.cell_contents)
+        fingerprint.add(merge_id)
+        return fingerprint.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, key, tape):
+        """Restore a template.
+
+        :param tape: tape to create the template registers in
+        :returns: tuple of instructions, arguments, number of rounds,
+          and side effects, or None if missing
+        """
+        try:
+            with open(self.entry(key)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            if data["version"] != self.VERSION:
+                return None
+            res = self.decode_template(data, tape)
+        except (KeyError, IndexError, TypeError, ValueError,
+                AttributeError):
+            # malformed entry
+            return None
+        os.utime(self.entry(key))
+        return res
+
+    def decode_template(self, data, tape):
+        from .instructions_base import Instruction
+        from .program import Tape
+
+        registers = []
+        for reg_type in data["registers"]:
+            reg = Tape.Register(reg_type, tape, size=None)
+            reg.reg_type = reg_type
+            registers.append(reg)
+        decode = lambda x: self.decode(x, registers)
+        classes = {}
+        instructions = []
+        for module, name, state in data["instructions"]:
+            if (module, name) not in classes:
+                if module.split(".")[0] != "Compiler":
+                    raise ValueError("not a compiler module: %s" % module)
+                cls = getattr(sys.modules[module], name)
+                if not (isinstance(cls, type) and
+                        issubclass(cls, Instruction)):
+                    raise ValueError("not an instruction: %s" % name)
+                classes[module, name] = cls, self.slots(cls)
+            cls, slots = classes[module, name]
+            inst = object.__new__(cls)
+            self.set_state(inst, slots, [(attr, decode(value))
+                                         for attr, value in state])
+            self.set_state(inst, slots, [("caller", None)])
+            instructions.append(inst)
+        args = [decode(arg) for arg in data["args"]]
+        effects = data["effects"]
+        effects["relevant_opts"] = set(effects["relevant_opts"])
+        return instructions, args, data["n_rounds"], effects
+
+    def store(self, key, instructions, args, n_rounds, effects):
+        """Store a template.
+
+        :param instructions: template instructions
+        :param args: registers and values used in the trace
+        :param n_rounds: number of rounds of the template
+        :param effects: side effects on the program to repeat on loading
+        :raises: :py:class:`Uncacheable`
+        """
+        from .instructions_base import format_str_is_writeable
+        from .program import Tape
+
+        Register = Tape.Register
+        constants = set(self.CONSTANTS)
+        registers = {}
+        reg_types = []
+        classes = {}
+
+        def new_register(reg):
+            # binary registers are copied depending on the vector size
+            if type(reg).copy is not Register.copy:
+                raise Uncacheable(repr(type(reg)))
+            registers[id(reg)] = len(reg_types)
+            reg_types.append(reg.reg_type)
+
+        def encode(value):
+            if type(value) in constants:
+                return ("const", value)
+            elif isinstance(value, list):
+                return ("list", [encode(x) for x in value])
+            elif isinstance(value, tuple):
+                return ("tuple", [encode(x) for x in value])
+            elif isinstance(value, Register):
+                try:
+                    return ("reg", registers[id(value)])
+                except KeyError:
+                    raise Uncacheable("register from outside the template")
+            else:
+                raise Uncacheable(repr(value))
+
+        for arg in args:
+            if isinstance(arg, Register):
+                new_register(arg)
+        encoded_args = [encode(arg) for arg in args]
+        encoded = []
+        for inst in instructions:
+            # mirror Instruction.get_new_args
+            for arg, f in zip(inst.args, inst.arg_format):
+                if isinstance(arg, Register) and id(arg) not in registers:
+                    if not format_str_is_writeable(f):
+                        raise Uncacheable(
+                            "register from outside the template")
+                    new_register(arg)
+            cls = type(inst)
+            if cls not in classes:
+                classes[cls] = self.find_class(cls) + (self.slots(cls),)
+            module, name, slots = classes[cls]
+            encoded.append((module, name,
+                            [(attr, encode(value)) for attr, value in
+                             self.get_state(inst, slots)]))
+        effects = dict(effects,
+                       relevant_opts=sorted(effects["relevant_opts"]))
+        data = {"version": self.VERSION, "registers": reg_types,
+                "instructions": encoded, "args": encoded_args,
+                "n_rounds": n_rounds, "effects": effects}
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.entry(key))
+        except (OSError, TypeError, ValueError):
+            os.remove(tmp)
+            raise
+
+    @staticmethod
+    def find_class(cls):
+        """Module and global name of an instruction class. Vectorized
+        classes are defined in :py:mod:`Compiler.instructions_base` but
+        registered in the module of the basic instruction."""
+        for base in cls.__mro__:
+            module = sys.modules.get(base.__module__)
+            for name in cls.__name__, cls.__name__ + "_class":
+                if getattr(module, name, None) is cls:
+                    return base.__module__, name
+        raise Uncacheable(repr(cls))
+
+    @staticmethod
+    def slots(cls):
+        """Slot descriptors by name, also if shadowed by class
+        attributes."""
+        res = {}
+        for base in reversed(cls.__mro__):
+            slots = base.__dict__.get("__slots__", ())
+            if isinstance(slots, str):
+                slots = [slots]
+            for name in slots:
+                res[name] = base.__dict__[name]
+        return res
+
+    @staticmethod
+    def get_state(inst, slots):
+        res = []
+        for name, descriptor in slots.items():
+            try:
+                res.append((name, descriptor.__get__(inst)))
+            except AttributeError:
+                pass
+        res += list(getattr(inst, "__dict__", {}).items())
+        return [(name, value) for name, value in res if name != "caller"]
+
+    @staticmethod
+    def set_state(inst, slots, state):
+        for name, value in state:
+            if name in slots:
+                slots[name].__set__(inst, value)
+            else:
+                setattr(inst, name, value)
+
+    @classmethod
+    def decode(cls, value, registers):
+        kind, x = value
+        if kind == "reg":
+            return registers[x]
+        elif kind == "list":
+            return [cls.decode(y, registers) for y in x]
+        elif kind == "tuple":
+            return tuple(cls.decode(y, registers) for y in x)
+        elif kind == "const":
+            return x
+        else:
+            raise ValueError("unknown kind: %s" % kind)
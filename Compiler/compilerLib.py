@@ -8,6 +8,7 @@ from optparse import OptionParser
 
 from Compiler.exceptions import CompilerError
 
+from . import compile_cache
 from .GC import types as GC_types
 from .program import Program, defaults
 
@@ -124,6 +125,26 @@ class Compiler:
             dest="profile",
             help="profile compilation",
         )
+        parser.add_option(
+            "--profile-phases",
+            action="store_true",
+            dest="profile_phases",
+            help="print time and memory per compilation phase, tape, "
+            "and large basic block",
+        )
+        parser.add_option(
+            "--profile-json",
+            dest="profile_json",
+            help="write time and memory per compilation phase to a JSON "
+            "file (implies --profile-phases)",
+        )
+        parser.add_option(
+            "--profile-memory",
+            action="store_true",
+            dest="profile_memory",
+            help="trace memory allocations per compilation phase "
+            "(implies --profile-phases, slow)",
+        )
         parser.add_option(
             "-s",
             "--stop",
@@ -181,6 +202,13 @@ class Compiler:
             help="set budget for optimized loop unrolling (default: %d)" % \
             defaults.budget,
         )
+        parser.add_option(
+            "--autotune",
+            dest="autotune",
+            help="choose the unrolling of optimized loops per loop to "
+            "meet targets such as rounds=N, instructions=N, or "
+            "registers=N (comma-separated)",
+        )
         parser.add_option(
             "-X",
             "--mixed",
@@ -239,6 +267,40 @@ class Compiler:
             dest="verbose",
             help="more verbose output",
         )
+        parser.add_option(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            type="int",
+            default=1,
+            help="number of processes for register allocation and "
+            "writing bytecode of threads; merging and CISC expansion "
+            "remain sequential (default: 1)",
+        )
+        parser.add_option(
+            "--cache",
+            dest="cache_dir",
+            default=os.getenv(compile_cache.CACHE_ENV),
+            help="directory for caching compiled programs "
+            "(default: $%s, no caching if unset)" % compile_cache.CACHE_ENV,
+        )
+        parser.add_option(
+            "--cache-size",
+            dest="cache_size",
+            type="int",
+            default=compile_cache.DEFAULT_MAX_SIZE,
+            help="size limit of the compilation cache in MB (default: %d)" %
+            compile_cache.DEFAULT_MAX_SIZE,
+        )
+        parser.add_option(
+            "--template-cache",
+            dest="template_cache",
+            default=os.getenv(compile_cache.TEMPLATE_CACHE_ENV),
+            help="directory for caching the instruction templates of "
+            "comparisons, truncation etc. across compilations "
+            "(default: $%s, no caching if unset)" %
+            compile_cache.TEMPLATE_CACHE_ENV,
+        )
         if self.execute:
             parser.add_option(
                 "-E",
@@ -448,15 +510,21 @@ class Compiler:
             else:
                 infile = open(self.prog.infile)
 
+        source = infile.read()
+        if changed and not self.options.debug:
+            os.unlink(infile.name)
+
+        cache_key = self.get_cache_key(source)
+        if self.restore_from_cache(cache_key):
+            return self.prog
+
         # make compiler modules directly accessible
         sys.path.insert(0, "%s/Compiler" % self.root)
         # create the tapes
-        exec(compile(infile.read(), infile.name, "exec"), self.VARS)
+        with self.prog.phase("tracing"):
+            exec(compile(source, infile.name, "exec"), self.VARS)
 
-        if changed and not self.options.debug:
-            os.unlink(infile.name)
-
-        return self.finalize_compile()
+        return self.finalize_compile(cache_key)
 
     def register_function(self, name=None):
         """
@@ -485,24 +553,99 @@ class Compiler:
         print(
             "Compiling: {} from {}".format(self.compile_name, self.compile_func.__name__)
         )
-        self.compile_function()
-        self.finalize_compile()
+        cache_key = self.get_cache_key(self.compile_function)
+        if self.restore_from_cache(cache_key):
+            return
+
+        def compilation():
+            with self.prog.phase("tracing"):
+                self.compile_function()
+            self.finalize_compile(cache_key)
+
+        if self.options.profile:
+            import cProfile
+
+            p = cProfile.Profile()
+            p.runcall(compilation)
+            p.dump_stats(self.compile_name + ".prof")
+            p.print_stats(2)
+        else:
+            compilation()
 
-    def finalize_compile(self):
+    def finalize_compile(self, cache_key=None):
         self.prog.finalize()
 
+        summary = []
         if self.prog.req_num:
-            print("Program requires at most:")
-            for x in self.prog.req_num.pretty():
-                print(x)
+            summary.append("Program requires at most:")
+            summary += self.prog.req_num.pretty()
+        for line in summary:
+            print(line)
 
         if self.prog.verbose:
             print("Program requires:", repr(self.prog.req_num))
             print("Cost:", 0 if self.prog.req_num is None else self.prog.req_num.cost())
             print("Memory size:", dict(self.prog.allocated_mem))
 
+        if cache_key:
+            self.store_in_cache(cache_key, summary)
+
+        if self.prog.autotuner and self.prog.autotuner.choices:
+            print(self.prog.autotuner.table())
+
+        profiler = self.prog.profiler
+        if profiler:
+            print(profiler.table(self.prog.name))
+            if self.options.profile_json:
+                profiler.write_json(self.options.profile_json, self.prog.name)
+                print("Wrote compilation profile to", self.options.profile_json)
+
         return self.prog
 
+    def get_cache(self):
+        if not self.options.cache_dir:
+            return None
+        return compile_cache.CompileCache(self.options.cache_dir,
+                                          self.options.cache_size)
+
+    def get_cache_key(self, source):
+        """Cache key for the source (str) or function to compile, or
+        :py:obj:`None` if caching is disabled or not possible."""
+        if not self.options.cache_dir:
+            return None
+        try:
+            return compile_cache.CompileCache.key(
+                self.options, [self.prog.name] + self.args, source)
+        except compile_cache.Uncacheable as e:
+            print("Not using compilation cache because of", e)
+            return None
+
+    def restore_from_cache(self, cache_key):
+        if not cache_key:
+            return False
+        meta = self.get_cache().restore(cache_key)
+        if meta is None:
+            return False
+        print("Restored %s from compilation cache" % self.prog.name)
+        public_input = self.get_public_input_filename()
+        if public_input in meta["files"]:
+            self.prog.public_input_filename = public_input
+        for line in meta["summary"]:
+            print(line)
+        return True
+
+    def store_in_cache(self, cache_key, summary):
+        prog = self.prog
+        filenames = [prog.programs_dir + "/Schedules/%s.sch" % prog.name]
+        filenames += [tape.outfile for tape in prog.tapes
+                      if os.path.exists(tape.outfile)]
+        if prog.public_input_filename is not None:
+            filenames.append(prog.public_input_filename)
+        self.get_cache().store(cache_key, filenames, summary)
+
+    def get_public_input_filename(self):
+        return self.prog.programs_dir + "/Public-Input/%s" % self.prog.name
+
     @staticmethod
     def executable_from_protocol(protocol):
         match = {
@@ -527,7 +670,7 @@ class Compiler:
             print("Creating binary for virtual machine...")
             try:
                 subprocess.run(["make", executable], check=True, cwd=self.root)
-            except:
+            except (OSError, subprocess.CalledProcessError):
                 raise CompilerError(
                     "Cannot produce %s. " % executable + \
                     "Note that compilation requires a few GB of RAM.")
@@ -1,5 +1,6 @@
 import heapq
 import collections
+from array import array
 from Compiler.exceptions import *
 
 class GraphError(CompilerError):
@@ -102,6 +103,239 @@ class SparseDiGraph(object):
         return len(self.succ[i])
 
 
+class ArrayDiGraph(object):
+    """ Directed graph stored in flat integer arrays, suitable for
+    dependency graphs of large basic blocks.
+
+    Edges are stored as consecutive quadruples (source, destination,
+    next outgoing edge of the source, next incoming edge of the
+    destination) in one array, which forms a linked list of successors
+    and one of predecessors per node. This costs a few machine words per
+    edge instead of dictionary and set entries. Successors are iterated
+    in insertion order. Removed edges are only marked as dead,
+    separately for both lists because :py:meth:`remove_node` keeps the
+    successors like :py:class:`SparseDiGraph` does.
+
+    The only node attribute is ``merges``, stored sparsely.
+    """
+    OUT = 1
+    IN = 2
+    # use a dictionary for membership beyond this number of successors
+    MAX_SCAN = 16
+
+    def __init__(self, max_nodes):
+        self.n = max_nodes
+        minus_one = array('l', [-1]) * max_nodes
+        self.out_head = array('l', minus_one)
+        self.out_tail = array('l', minus_one)
+        self.in_head = array('l', minus_one)
+        self.in_tail = array('l', minus_one)
+        # largest successor ever added, edges beyond are new
+        self.max_succ = array('l', minus_one)
+        self.out_deg = array('l', [0]) * max_nodes
+        self.in_deg = array('l', [0]) * max_nodes
+        self.edges = array('l')
+        self.alive = bytearray()
+        self.out_maps = {}
+        self.attributes = {}
+        self.pred = self.Predecessors(self)
+
+    class Predecessors(object):
+        def __init__(self, G):
+            self.G = G
+
+        def __getitem__(self, i):
+            return self.G.predecessors(i)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        """ Get list of the successors of node i """
+        res = []
+        edges, alive = self.edges, self.alive
+        e = self.out_head[i]
+        while e != -1:
+            if alive[e] & 1:
+                res.append(edges[4 * e + 1])
+            e = edges[4 * e + 2]
+        return res
+
+    def __contains__(self, i):
+        return i >= 0 and i < self.n
+
+    def predecessors(self, i):
+        res = []
+        edges, alive = self.edges, self.alive
+        e = self.in_head[i]
+        while e != -1:
+            if alive[e] & 2:
+                res.append(edges[4 * e])
+            e = edges[4 * e + 3]
+        return res
+
+    def add_node(self, i, **attr):
+        if i >= self.n:
+            raise CompilerError('Cannot add node %d to graph of size %d' % (i, self.n))
+        for a, value in attr.items():
+            self.set_attr(i, a, value)
+
+    def set_attr(self, i, attr, value):
+        if attr != 'merges':
+            raise CompilerError('Invalid attribute %s for graph node' % attr)
+        self.attributes[i] = value
+
+    def get_attr(self, i, attr):
+        if attr != 'merges':
+            raise CompilerError('Invalid attribute %s for graph node' % attr)
+        return self.attributes.get(i)
+
+    def out_map(self, i):
+        """ Successors of node i with edge indices, created on demand
+        and kept up to date afterwards. """
+        if i not in self.out_maps:
+            res = {}
+            edges, alive = self.edges, self.alive
+            e = self.out_head[i]
+            while e != -1:
+                if alive[e] & 1:
+                    res[edges[4 * e + 1]] = e
+                e = edges[4 * e + 2]
+            self.out_maps[i] = res
+        return self.out_maps[i]
+
+    def has_edge(self, i, j):
+        if j > self.max_succ[i]:
+            return False
+        edges, alive = self.edges, self.alive
+        # repeated edges while building a dependency graph
+        tail = self.out_tail[i]
+        if edges[4 * tail + 1] == j and alive[tail] & 1:
+            return True
+        if i in self.out_maps or self.out_deg[i] > self.MAX_SCAN:
+            return j in self.out_map(i)
+        e = self.out_head[i]
+        while e != -1:
+            if edges[4 * e + 1] == j and alive[e] & 1:
+                return True
+            e = edges[4 * e + 2]
+        return False
+
+    def add_edge(self, i, j):
+        max_succ = self.max_succ
+        if j > max_succ[i]:
+            max_succ[i] = j
+        elif self.has_edge(i, j):
+            return
+        edges = self.edges
+        e = len(self.alive)
+        edges.extend((i, j, -1, -1))
+        self.alive.append(3)
+        tail = self.out_tail[i]
+        if tail == -1:
+            self.out_head[i] = e
+        else:
+            edges[4 * tail + 2] = e
+        self.out_tail[i] = e
+        tail = self.in_tail[j]
+        if tail == -1:
+            self.in_head[j] = e
+        else:
+            edges[4 * tail + 3] = e
+        self.in_tail[j] = e
+        self.out_deg[i] += 1
+        self.in_deg[j] += 1
+        if i in self.out_maps:
+            self.out_maps[i][j] = e
+
+    def add_edges_from(self, pairs):
+        for i, j in pairs:
+            self.add_edge(i, j)
+
+    def remove_from_succ(self, e):
+        self.alive[e] &= ~self.OUT
+        i = self.edges[4 * e]
+        self.out_deg[i] -= 1
+        if i in self.out_maps:
+            del self.out_maps[i][self.edges[4 * e + 1]]
+
+    def remove_from_pred(self, e):
+        self.alive[e] &= ~self.IN
+        self.in_deg[self.edges[4 * e + 1]] -= 1
+
+    def remove_edge(self, i, j):
+        e = self.out_map(i)[j]
+        self.remove_from_succ(e)
+        self.remove_from_pred(e)
+
+    def remove_edges_from(self, pairs):
+        for i, j in pairs:
+            self.remove_edge(i, j)
+
+    def remove_node(self, i):
+        """ Remove node i from its neighbours and reset its
+        attributes. Like :py:class:`SparseDiGraph`, this keeps the
+        list of successors of node i. """
+        edges, alive = self.edges, self.alive
+        e = self.out_head[i]
+        while e != -1:
+            if alive[e] & self.IN:
+                self.remove_from_pred(e)
+            e = edges[4 * e + 2]
+        e = self.in_head[i]
+        while e != -1:
+            if alive[e] & self.IN:
+                self.remove_from_pred(e)
+                self.remove_from_succ(e)
+            e = edges[4 * e + 3]
+        self.attributes.pop(i, None)
+
+    def degree(self, i):
+        return self.out_deg[i]
+
+    def in_degree(self, i):
+        return self.in_deg[i]
+
+    def topological_sort(self):
+        """ Same order as :py:func:`topological_sort` without
+        arguments. """
+        n = self.n
+        out_head, edges, alive = self.out_head, self.edges, self.alive
+        explored = bytearray(n)
+        seen = bytearray(n)
+        order_explored = []
+        for v in range(n - 1, -1, -1):
+            if explored[v]:
+                continue
+            fringe = [v]
+            while fringe:
+                w = fringe[-1]
+                if explored[w]:
+                    fringe.pop()
+                    continue
+                seen[w] = 1
+                new_nodes = []
+                e = out_head[w]
+                while e != -1:
+                    if alive[e] & 1:
+                        m = edges[4 * e + 1]
+                        if not explored[m]:
+                            if seen[m]:
+                                raise GraphError(
+                                    "Graph contains a cycle at %d (%s,%s)." % \
+                                    (m, self[m], self.pred[m]))
+                            new_nodes.append(m)
+                    e = edges[4 * e + 2]
+                if new_nodes:
+                    fringe.extend(new_nodes)
+                else:
+                    explored[w] = 1
+                    order_explored.append(w)
+                    fringe.pop()
+        order_explored.reverse()
+        return order_explored
+
+
 def topological_sort(G, nbunch=None, pref=None):
     seen={}
     order_explored=[] # provide order and 
@@ -471,40 +471,20 @@ def cisc(function, n_outputs=1):
             if self.merge_id() not in self.instructions:
                 from Compiler.program import Tape
                 tape = Tape(self.function.__name__, program)
-                old_tape = program.curr_tape
-                program.curr_tape = tape
-                block = tape.BasicBlock(tape, None, None)
-                tape.active_basicblock = block
-                set_global_vector_size(None)
-                args = []
-                for arg in self.args:
-                    try:
-                        args.append(arg.new_vector(size=None))
-                    except:
-                        args.append(arg)
-                program.options.cisc = False
-                old_security = program._security
-                program.security = self.security
-                self.function(*args, **self.kwargs)
-                program.security = old_security
-                program.options.cisc = True
-                reset_global_vector_size()
-                program.curr_tape = old_tape
-                for x, bl in tape.req_bit_length.items():
-                    old_tape.require_bit_length(bl - 1, x)
-                from Compiler.allocator import Merger
-                merger = Merger(block, program.options,
-                                tuple(program.to_merge))
-                for i in range(n_outputs):
-                    args[i].can_eliminate = False
-                merger.eliminate_dead_code()
-                assert int(program.options.max_parallel_open) == 0, \
-                    'merging restriction not compatible with ' \
-                    'mergeable CISC instructions'
-                n_rounds = merger.longest_paths_merge()
-                filtered = filter(lambda x: x is not None, block.instructions)
-                self.instructions[self.merge_id()] = list(filtered), args, \
-                                                     n_rounds
+                cache_key = self.get_cache_key()
+                cached = None
+                if cache_key:
+                    cached = program.template_cache.load(cache_key, tape)
+                if cached:
+                    template, args, n_rounds, effects = cached
+                    for x, bl in effects['req_bit_length'].items():
+                        program.curr_tape.require_bit_length(bl - 1, x)
+                    program.relevant_opts.update(effects['relevant_opts'])
+                    program.used_security = max(program.used_security,
+                                                effects['used_security'])
+                else:
+                    template, args, n_rounds = self.trace(tape, cache_key)
+                self.instructions[self.merge_id()] = template, args, n_rounds
             template, args, self.n_rounds = self.instructions[self.merge_id()]
             subs = util.dict_by_id()
             from Compiler import types
@@ -516,6 +496,68 @@ def cisc(function, n_outputs=1):
                 inst.copy(size, subs)
             reset_global_vector_size()
 
+        def get_cache_key(self):
+            if not program.template_cache:
+                return None
+            from Compiler.compile_cache import Uncacheable
+            try:
+                return program.template_cache.key(program, self.merge_id())
+            except Uncacheable:
+                return None
+
+        def trace(self, tape, cache_key=None):
+            old_tape = program.curr_tape
+            old_opts = set(program.relevant_opts)
+            old_mem = program.allocated_mem.copy()
+            tape_counter = program.tape_counter
+            program.curr_tape = tape
+            block = tape.BasicBlock(tape, None, None)
+            tape.active_basicblock = block
+            set_global_vector_size(None)
+            args = []
+            for arg in self.args:
+                try:
+                    args.append(arg.new_vector(size=None))
+                except:
+                    args.append(arg)
+            program.options.cisc = False
+            old_security = program._security
+            program.security = self.security
+            self.function(*args, **self.kwargs)
+            program.security = old_security
+            program.options.cisc = True
+            reset_global_vector_size()
+            program.curr_tape = old_tape
+            for x, bl in tape.req_bit_length.items():
+                old_tape.require_bit_length(bl - 1, x)
+            from Compiler.allocator import Merger
+            merger = Merger(block, program.options,
+                            tuple(program.to_merge))
+            for i in range(n_outputs):
+                args[i].can_eliminate = False
+            merger.eliminate_dead_code()
+            assert int(program.options.max_parallel_open) == 0, \
+                'merging restriction not compatible with ' \
+                'mergeable CISC instructions'
+            n_rounds = merger.longest_paths_merge()
+            template = list(filter(lambda x: x is not None,
+                                   block.instructions))
+            # templates allocating memory or tapes cannot be replayed
+            if cache_key and program.allocated_mem == old_mem and \
+               program.tape_counter == tape_counter:
+                from Compiler.compile_cache import Uncacheable
+                effects = {
+                    'req_bit_length': dict(tape.req_bit_length),
+                    'relevant_opts': program.relevant_opts - old_opts,
+                    'used_security': program.used_security,
+                }
+                try:
+                    program.template_cache.store(cache_key, template, args,
+                                                 n_rounds, effects)
+                except Uncacheable:
+                    pass
+            return template, args, n_rounds
+
         def expand_to_function(self, size, new_regs):
             key = size, program.curr_tape, \
                 tuple(arg for arg, reg in zip(self.args, new_regs) if reg is None), \
@@ -749,6 +791,13 @@ class ArgFormat(object):
     def encode(cls, arg):
         return NotImplemented
 
+    @classmethod
+    def from_value(cls, value):
+        """ Parsed argument from a decoded value. """
+        res = cls.__new__(cls)
+        res.i = value
+        return res
+
 class RegisterArgFormat(ArgFormat):
     is_reg = True
 
@@ -867,6 +916,12 @@ class String(ArgFormat):
         tmp = f.read(16)
         self.str = str(tmp[0:tmp.find(b'\0')], 'ascii')
 
+    @classmethod
+    def from_value(cls, value):
+        res = cls.__new__(cls)
+        res.str = value
+        return res
+
     def __str__(self):
         return self.str
 
@@ -884,6 +939,8 @@ class VarString(ArgFormat):
         length = IntArgFormat(f).i
         self.str = str(f.read(length), 'ascii')
 
+    from_value = String.from_value
+
     def __str__(self):
         return self.str
 
@@ -1075,8 +1132,8 @@ class Instruction(object):
 class ParsedInstruction:
     reverse_opcodes = {}
 
-    def __init__(self, f):
-        cls = type(self)
+    @classmethod
+    def init_reverse_opcodes(cls):
         from Compiler import instructions
         from Compiler.GC import instructions as gc_inst
         if not cls.reverse_opcodes:
@@ -1087,6 +1144,10 @@ class ParsedInstruction:
                             cls.reverse_opcodes[y.code] = y
                         except AttributeError:
                             pass
+
+    def __init__(self, f):
+        cls = type(self)
+        cls.init_reverse_opcodes()
         read = lambda: struct.unpack('>I', f.read(4))[0]
         full_code = struct.unpack('>Q', f.read(8))[0]
         self.code = full_code % (1 << Instruction.code_length)
@@ -1119,6 +1180,27 @@ class ParsedInstruction:
         for i in range(n_args):
             self.args.append(ArgFormats[next(arg_format)](f))
 
+    @classmethod
+    def from_values(cls, type, size, args, formats, var_args):
+        """ Parsed instruction from values decoded by
+        :py:mod:`Compiler.bytecode`. The argument objects are only
+        created when accessed. """
+        res = cls.__new__(cls)
+        res.type = type
+        res.code = type.code
+        res.size = size
+        res.var_args = var_args
+        res.values = args
+        res.formats = formats
+        return res
+
+    def __getattr__(self, name):
+        if name == 'args':
+            self.args = [ArgFormats[f].from_value(value)
+                         for value, f in zip(self.values, self.formats)]
+            return self.args
+        raise AttributeError(name)
+
     def __str__(self):
         name = self.type.__name__
         res = name + ' '
@@ -1130,6 +1212,8 @@ class ParsedInstruction:
         return res
 
     def get_usage(self):
+        if self.type.get_usage is Instruction.get_usage:
+            return {}
         return self.type.get_usage(self.args)
 
 class VarArgsInstruction(Instruction):
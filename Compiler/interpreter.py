@@ -0,0 +1,710 @@
+"""
+This module executes compiled programs in the clear for testing. The
+tapes in ``Programs/Bytecode`` are decoded with
+:py:func:`Compiler.bytecode.decode`, and every instruction is executed
+by a Python function registered for its name (see :py:func:`handler`).
+Secret and clear values are plain integers modulo the same prime or
+power of two that the virtual machine would use, so the output is the
+output of party 0 in a real execution (without the statistics printed
+by the virtual machine). Vector instructions are executed on whole
+register ranges at once.
+
+Only the instructions used by typical arithmetic programs are
+supported. Correlated randomness (bits, triples, shuffles) is sampled
+locally, which makes no difference for correct programs. Threads are
+run to completion when started.
+
+Example::
+
+    from Compiler.interpreter import Interpreter
+
+    print(Interpreter('tutorial', n_players=2).run(), end='')
+
+``Scripts/interpret.py`` provides the same from the command line.
+"""
+
+import functools
+import itertools
+import math
+import operator
+import random
+from fractions import Fraction
+
+from Compiler import bytecode
+from Compiler import instructions_base as base
+
+
+class InterpreterError(RuntimeError):
+    """ Error during execution where the virtual machine would abort. """
+    pass
+
+
+def is_probable_prime(n, rounds=40):
+    """ Miller-Rabin primality test. """
+    if n < 2:
+        return False
+    for q in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % q == 0:
+            return n == q
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    rng = random.Random(n)
+    for _ in range(rounds):
+        x = pow(rng.randrange(2, n - 1), d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def default_prime(lgp):
+    """ The prime that the virtual machine generates for a bit length
+    (see ``Math/Setup.cpp``). """
+    m = {32: 8192, 64: 16384, 128: 32768, 256: 32768,
+         512: 65536}.get(lgp, 1)
+    u = m << (lgp - m.bit_length())
+    while not is_probable_prime(u + 1) or (u + 1).bit_length() < lgp:
+        u += m
+    return u + 1
+
+
+def wrap64(x):
+    """ Two's complement reduction as for ``regint``. """
+    return ((x + (1 << 63)) & ((1 << 64) - 1)) - (1 << 63)
+
+
+_reg_types = {}
+
+
+def reg_type(format_str):
+    """ Register type of an argument format or None if not a
+    register. """
+    try:
+        return _reg_types[format_str]
+    except KeyError:
+        t = base.ArgFormats[format_str]
+        res = _reg_types[format_str] = t.reg_type if t.is_reg else None
+        return res
+
+
+handlers = {}
+
+
+def handler(*names):
+    """ Register a function executing instructions. It is called with
+    the :py:class:`Processor`, the vector size, the arguments, and the
+    argument formats and returns a relative jump or None. """
+    def decorator(execute):
+        for name in names:
+            handlers[name] = execute
+        return execute
+    return decorator
+
+
+def elementwise(proc, size, args, formats, function):
+    """ Apply a function to all elements of the source registers (or
+    immediate values) and write to the destination register. """
+    n = size or 1
+    values = []
+    for f, arg in zip(formats[1:], args[1:]):
+        t = reg_type(f)
+        values.append(proc.read(t, arg, n) if t else itertools.repeat(arg, n))
+    t = reg_type(formats[0])
+    reduce = proc.reducers[t]
+    proc.write(t, args[0], [reduce(function(*x)) for x in zip(*values)])
+
+
+def c_division(a, b):
+    """ Integer division rounding towards zero as in C. """
+    if b == 0:
+        raise InterpreterError('division by zero')
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+for names, function in (
+        (('addc', 'adds', 'addm', 'addci', 'addsi', 'addint'), operator.add),
+        (('subc', 'subs', 'subml', 'submr', 'subci', 'subsi', 'subint'),
+         operator.sub),
+        (('subcfi', 'subsfi'), lambda x, y: y - x),
+        (('mulc', 'mulm', 'mulci', 'mulsi', 'mulint'), operator.mul),
+        (('modc', 'modci'), operator.mod),
+        (('floordivc',), operator.floordiv),
+        (('divint',), c_division),
+        (('andc', 'andci'), operator.and_),
+        (('orc', 'orci'), operator.or_),
+        (('xorc', 'xorci'), operator.xor),
+        (('shlc', 'shlci'), operator.lshift),
+        (('shrc', 'shrci'), operator.rshift),
+        (('ltc',), lambda x, y: int(x < y)),
+        (('gtc',), lambda x, y: int(x > y)),
+        (('eqc',), lambda x, y: int(x == y)),
+        (('eqzc',), lambda x: int(x == 0)),
+        (('ltzc',), lambda x: int(x < 0)),
+        (('ldi', 'ldsi', 'ldint', 'movc', 'movs', 'movint', 'convint'),
+         lambda x: x)):
+    for name in names:
+        handlers[name] = functools.partial(elementwise, function=function)
+
+
+@handler('inv2m')
+def _inv2m(proc, size, args, formats):
+    elementwise(proc, size, args, formats, lambda n: proc.inverse(1 << n))
+
+
+@handler('divc', 'divci')
+def _divc(proc, size, args, formats):
+    elementwise(proc, size, args, formats, lambda x, y: x * proc.inverse(y))
+
+
+@handler('convmodp')
+def _convmodp(proc, size, args, formats):
+    def convert(x, n_bits):
+        if n_bits == 0:
+            return x
+        x = proc.signed(x)
+        x = -(-x & ((1 << 64) - 1)) if x < 0 else x & ((1 << 64) - 1)
+        if n_bits == 1:
+            return x & 1
+        elif n_bits < 64:
+            mask = (1 << n_bits) - 1
+            return -(-x & mask) if x < 0 else x & mask
+        else:
+            return x
+    elementwise(proc, size, args, formats, convert)
+
+
+@handler('incint')
+def _incint(proc, size, args, formats):
+    dest, base_reg, increment, repeat, wrap = args
+    start = proc.read('ci', base_reg, 1)[0]
+    proc.write('ci', dest, [wrap64(start + (i // repeat) % wrap * increment)
+                            for i in range(size or 1)])
+
+
+@handler('bitdecint')
+def _bitdecint(proc, size, args, formats):
+    values = proc.read('ci', args[0], size or 1)
+    for i, dest in enumerate(args[1:]):
+        proc.write('ci', dest, [(x >> i) & 1 for x in values])
+
+
+@handler('prefixsums')
+def _prefixsums(proc, size, args, formats):
+    modulus = proc.modulus
+    proc.write('s', args[0], [x % modulus for x in itertools.accumulate(
+        proc.read('s', args[1], size or 1))])
+
+
+@handler('picks')
+def _picks(proc, size, args, formats):
+    dest, source, start, step = args
+    n = size or 1
+    values = proc.read('s', source, start + step * (n - 1) + 1)
+    proc.write('s', dest, [values[start + i * step] for i in range(n)])
+
+
+@handler('concats')
+def _concats(proc, size, args, formats):
+    res = []
+    for n, source in zip(args[1::2], args[2::2]):
+        res += proc.read('s', source, n)
+    proc.write('s', args[0], res)
+
+
+@handler('asm_open')
+def _asm_open(proc, size, args, formats):
+    for dest, source in zip(args[1::2], args[2::2]):
+        proc.write('c', dest, proc.read('s', source, size or 1))
+
+
+@handler('muls')
+def _muls(proc, size, args, formats):
+    modulus = proc.modulus
+    for i in range(0, len(args), 4):
+        n, dest, x, y = args[i:i + 4]
+        proc.write('s', dest, [a * b % modulus for a, b in zip(
+            proc.read('s', x, n), proc.read('s', y, n))])
+
+
+@handler('dotprods')
+def _dotprods(proc, size, args, formats):
+    n = size or 1
+    i = 0
+    while i < len(args):
+        length, dest = args[i:i + 2]
+        res = [0] * n
+        for x, y in zip(args[i + 2:i + length:2], args[i + 3:i + length:2]):
+            for j, (a, b) in enumerate(zip(proc.read('s', x, n),
+                                           proc.read('s', y, n))):
+                res[j] += a * b
+        proc.write('s', dest, [x % proc.modulus for x in res])
+        i += length
+
+
+@handler('matmuls')
+def _matmuls(proc, size, args, formats):
+    modulus = proc.modulus
+    for i in range(0, len(args), 6):
+        dest, a, b, n_rows, n_inner, n_cols = args[i:i + 6]
+        A = proc.read('s', a, n_rows * n_inner)
+        B = proc.read('s', b, n_inner * n_cols)
+        columns = [B[j::n_cols] for j in range(n_cols)]
+        res = []
+        for j in range(n_rows):
+            row = A[j * n_inner:(j + 1) * n_inner]
+            res += [sum(map(operator.mul, row, column)) % modulus
+                    for column in columns]
+        proc.write('s', dest, res)
+
+
+@handler('trunc_pr')
+def _trunc_pr(proc, size, args, formats):
+    rng = proc.interpreter.random
+    for i in range(0, len(args), 4):
+        dest, source, k, m = args[i:i + 4]
+        res = []
+        for x in proc.read('s', source, size or 1):
+            q, r = divmod(proc.signed(x), 1 << m)
+            res.append((q + (rng.getrandbits(m) < r)) % proc.modulus)
+        proc.write('s', dest, res)
+
+
+@handler('bit')
+def _bit(proc, size, args, formats):
+    rng = proc.interpreter.random
+    proc.write('s', args[0], [rng.getrandbits(1) for i in range(size or 1)])
+
+
+@handler('randoms')
+def _randoms(proc, size, args, formats):
+    rng = proc.interpreter.random
+    proc.write('s', args[0], [rng.getrandbits(args[1])
+                              for i in range(size or 1)])
+
+
+@handler('randomfulls')
+def _randomfulls(proc, size, args, formats):
+    rng = proc.interpreter.random
+    proc.write('s', args[0], [rng.randrange(proc.modulus)
+                              for i in range(size or 1)])
+
+
+def random_tuple(proc, size, args, formats, function):
+    """ Random non-zero elements with derived values. """
+    rng = proc.interpreter.random
+    a = [rng.randrange(1, proc.modulus) for i in range(size or 1)]
+    for dest, values in zip(args, function(proc, a)):
+        proc.write('s', dest, values)
+
+
+def _triple(proc, a):
+    b = [proc.interpreter.random.randrange(proc.modulus) for x in a]
+    return a, b, [x * y % proc.modulus for x, y in zip(a, b)]
+
+
+handlers['triple'] = functools.partial(random_tuple, function=_triple)
+handlers['square'] = functools.partial(
+    random_tuple, function=lambda proc, a: (
+        a, [x * x % proc.modulus for x in a]))
+handlers['inverse'] = functools.partial(
+    random_tuple, function=lambda proc, a: (
+        a, [proc.inverse(x) for x in a]))
+
+
+@handler('inputmixed')
+def _inputmixed(proc, size, args, formats):
+    from Compiler.instructions import inputmixed_base
+
+    i = 0
+    while i < len(args):
+        t = args[i]
+        n_dest, n_param = inputmixed_base.types[t]
+        if t == 2:
+            raise InterpreterError('floating-point input not supported')
+        precision = args[i + 2] if n_param else 0
+        player = args[i + 1 + n_dest + n_param]
+        values = []
+        for _ in range(size or 1):
+            token = proc.interpreter.next_input(player, proc.thread)
+            if t == 0:
+                values.append(int(token))
+            else:
+                # rounding half away from zero as in C
+                x = float(token) * 2 ** precision
+                values.append(int(math.copysign(math.floor(abs(x) + 0.5), x)))
+        proc.write('s', args[i + 1], [x % proc.modulus for x in values])
+        i += n_dest + n_param + 2
+
+
+@handler('gensecshuffle')
+def _gensecshuffle(proc, size, args, formats):
+    perm = list(range(args[1]))
+    proc.interpreter.random.shuffle(perm)
+    shuffles = proc.interpreter.shuffles
+    shuffles.append(perm)
+    proc.write('ci', args[0], [len(shuffles) - 1])
+
+
+@handler('applyshuffle')
+def _applyshuffle(proc, size, args, formats):
+    dest, source, unit_size, handle, reverse = args
+    perm = proc.interpreter.shuffles[proc.read('ci', handle, 1)[0]]
+    values = proc.read('s', source, size or 1)
+    units = [values[i:i + unit_size] for i in range(0, len(values), unit_size)]
+    if perm is None or len(units) != len(perm):
+        raise InterpreterError('invalid shuffle')
+    res = [None] * len(units)
+    for i, j in enumerate(perm):
+        if reverse:
+            res[j] = units[i]
+        else:
+            res[i] = units[j]
+    proc.write('s', dest, list(itertools.chain(*res)))
+
+
+@handler('delshuffle')
+def _delshuffle(proc, size, args, formats):
+    proc.interpreter.shuffles[proc.read('ci', args[0], 1)[0]] = None
+
+
+@handler('jmp')
+def _jmp(proc, size, args, formats):
+    return args[0]
+
+
+@handler('jmpnz')
+def _jmpnz(proc, size, args, formats):
+    if proc.read('ci', args[0], 1)[0]:
+        return args[1]
+
+
+@handler('jmpeqz')
+def _jmpeqz(proc, size, args, formats):
+    if not proc.read('ci', args[0], 1)[0]:
+        return args[1]
+
+
+@handler('jmpi')
+def _jmpi(proc, size, args, formats):
+    return proc.read('ci', args[0], 1)[0]
+
+
+@handler('crash')
+def _crash(proc, size, args, formats):
+    if proc.read('ci', args[0], 1)[0]:
+        raise InterpreterError('crash requested')
+
+
+@handler('ldarg')
+def _ldarg(proc, size, args, formats):
+    proc.write('ci', args[0], [proc.arg])
+
+
+@handler('starg')
+def _starg(proc, size, args, formats):
+    proc.arg = proc.read('ci', args[0], 1)[0]
+
+
+@handler('ldtn')
+def _ldtn(proc, size, args, formats):
+    proc.write('ci', args[0], [proc.thread])
+
+
+@handler('nplayers')
+def _nplayers(proc, size, args, formats):
+    proc.write('ci', args[0], [proc.interpreter.n_players])
+
+
+@handler('threshold')
+def _threshold(proc, size, args, formats):
+    proc.write('ci', args[0], [proc.interpreter.n_players - 1])
+
+
+@handler('playerid')
+def _playerid(proc, size, args, formats):
+    proc.write('ci', args[0], [0])
+
+
+@handler('run_tape')
+def _run_tape(proc, size, args, formats):
+    for thread, tape, arg in zip(args[::3], args[1::3], args[2::3]):
+        Processor(proc.interpreter, tape, thread, arg).run()
+
+
+@handler('join_tape', 'reqbl', 'active', 'use', 'use_inp', 'use_edabit',
+         'use_matmul', 'use_prep', 'time', 'start', 'stop')
+def _nop(proc, size, args, formats):
+    pass
+
+
+@handler('print_reg_plain')
+def _print_reg_plain(proc, size, args, formats):
+    proc.interpreter.print_vector(
+        str(proc.signed(x)) for x in proc.read('c', args[0], size or 1))
+
+
+@handler('print_int')
+def _print_int(proc, size, args, formats):
+    proc.interpreter.print_vector(
+        str(x) for x in proc.read('ci', args[0], size or 1))
+
+
+@handler('print_float_plain')
+def _print_float_plain(proc, size, args, formats):
+    n = size or 1
+    v, p, z, s, nan = (proc.read('c', arg, n) for arg in args)
+    proc.interpreter.print_vector(
+        'NaN' if nan[i] else proc.format_float(v[i], p[i], z[i], s[i])
+        for i in range(n))
+
+
+@handler('cond_print_plain')
+def _cond_print_plain(proc, size, args, formats):
+    n = size or 1
+    if proc.read('c', args[0], 1)[0]:
+        v = proc.read('c', args[1], n)
+        p = proc.read('c', args[2], n)
+        if p[0]:
+            res = (proc.format_float(x, y) for x, y in zip(v, p))
+        else:
+            res = (str(proc.signed(x)) for x in v)
+        proc.interpreter.print_vector(res)
+
+
+@handler('print_char')
+def _print_char(proc, size, args, formats):
+    proc.interpreter.out.append(args[0] & 0xff)
+
+
+@handler('print_char4')
+def _print_char4(proc, size, args, formats):
+    proc.interpreter.out.extend(args[0].to_bytes(4, 'little'))
+
+
+@handler('cond_print_str')
+def _cond_print_str(proc, size, args, formats):
+    if proc.read('c', args[0], 1)[0]:
+        proc.interpreter.out.extend(
+            args[1].to_bytes(4, 'little').partition(b'\0')[0])
+
+
+@handler('print_float_prec')
+def _print_float_prec(proc, size, args, formats):
+    proc.interpreter.precision = args[0]
+
+
+def memory_handler(t):
+    """ Handler for memory instructions of any type or None. """
+    if issubclass(t, base.DirectMemoryInstruction):
+        direct = True
+    elif issubclass(t, base.IndirectMemoryInstruction):
+        direct = False
+    else:
+        return None
+    write = issubclass(t, base.WriteMemoryInstruction)
+
+    def execute(proc, size, args, formats):
+        n = size or 1
+        value_type = reg_type(formats[0])
+        memory = proc.interpreter.memory[value_type]
+        reg, address = args
+        if direct:
+            addresses = range(address, address + n)
+        else:
+            addresses = proc.read('ci', address, n)
+        if write:
+            for i, x in zip(addresses, proc.read(value_type, reg, n)):
+                memory[i] = x
+        else:
+            proc.write(value_type, reg,
+                       [memory.get(i, 0) for i in addresses])
+    return execute
+
+
+def unsupported(proc, size, args, formats, name):
+    raise InterpreterError('instruction %s not supported' % name)
+
+
+_handlers = {}
+
+
+def get_handler(t):
+    """ Function executing instructions of a class. """
+    try:
+        return _handlers[t]
+    except KeyError:
+        res = handlers.get(t.__name__) or memory_handler(t) or \
+            functools.partial(unsupported, name=t.__name__)
+        _handlers[t] = res
+        return res
+
+
+class Processor:
+    """ Execution of one tape in a thread.
+
+    :param interpreter: :py:class:`Interpreter`
+    :param tape: tape number
+    :param thread: thread number
+    :param arg: tape argument (see :py:func:`~Compiler.library.get_arg`)
+    """
+
+    def __init__(self, interpreter, tape, thread=0, arg=0):
+        self.interpreter = interpreter
+        self.modulus = modulus = interpreter.modulus
+        self.tape = tape
+        self.thread = thread
+        self.arg = arg
+        self.regs = {t: [] for t in base.RegType.Types}
+        self.reducers = {t: lambda x: x for t in base.RegType.Types}
+        self.reducers.update(s=lambda x: x % modulus,
+                             c=lambda x: x % modulus, ci=wrap64)
+
+    def run(self):
+        code = self.interpreter.instructions(self.tape)
+        pc = 0
+        end = len(code)
+        while pc < end:
+            t, execute, size, args, formats = code[pc]
+            try:
+                jump = execute(self, size, args, formats)
+            except (InterpreterError, ArithmeticError, IndexError,
+                    ValueError) as e:
+                raise InterpreterError(
+                    '%s in instruction %d (%s) of tape %s' % (
+                        e, pc, t.__name__,
+                        self.interpreter.tapes[self.tape])) from e
+            pc += 1
+            if jump:
+                pc += jump
+
+    def read(self, t, start, n):
+        regs = self.regs[t]
+        if start + n > len(regs):
+            regs.extend([0] * (start + n - len(regs)))
+        return regs[start:start + n]
+
+    def write(self, t, start, values):
+        regs = self.regs[t]
+        end = start + len(values)
+        if end > len(regs):
+            regs.extend([0] * (end - len(regs)))
+        regs[start:end] = values
+
+    def signed(self, x):
+        return x - self.modulus if x >= self.modulus // 2 else x
+
+    def inverse(self, x):
+        try:
+            return pow(x, -1, self.modulus)
+        except ValueError:
+            raise InterpreterError('%d not invertible' % x)
+
+    def format_float(self, v, p, z=0, s=0):
+        """ Output of ``v * 2^p`` like the virtual machine. """
+        value = Fraction(self.signed(v)) * Fraction(2) ** self.signed(p)
+        if z == 1:
+            value = 0
+        if s == 1:
+            value = -value
+        if not value:
+            return '0'
+        return '%.*g' % (self.interpreter.precision, value)
+
+
+class Interpreter:
+    """ Clear execution of a compiled program.
+
+    :param program: program name with arguments as in
+      ``Programs/Schedules``
+    :param n_players: number of parties
+    :param input_prefix: prefix of the input files, which are read as
+      by the virtual machine
+    :param prime: prime modulus (default: as the virtual machine
+      chooses it for the program)
+    :param lgp: minimal bit length of the prime (128 by default as in
+      the virtual machine)
+    :param seed: seed for local randomness
+    """
+
+    def __init__(self, program, n_players=2,
+                 input_prefix='Player-Data/Input', prime=None, lgp=128,
+                 seed=None):
+        from Compiler.program import Program
+
+        self.program = program
+        self.n_players = n_players
+        self.input_prefix = input_prefix
+        self.tapes = list(Program.read_tapes(program))
+        self.modulus = prime
+        for line in Program.read_schedule(program)[3:]:
+            line = line.strip()
+            if self.modulus:
+                break
+            if line.startswith('R:'):
+                self.modulus = 1 << int(line[2:])
+            elif line.startswith('p:'):
+                self.modulus = int(line[2:])
+            elif line.startswith('lgp:'):
+                lgp = max(lgp, -(-int(line[4:]) // 64) * 64)
+        if not self.modulus:
+            self.modulus = default_prime(lgp)
+        self.random = random.Random(seed)
+        self.memory = {t: {} for t in base.RegType.Types}
+        self.shuffles = []
+        self.inputs = {}
+        self.decoded = {}
+        self.precision = 6
+        self.out = bytearray()
+
+    def instructions(self, tape):
+        """ Decoded instructions of a tape as tuples (class, handler,
+        vector size, arguments, argument formats). """
+        try:
+            return self.decoded[tape]
+        except KeyError:
+            filename = 'Programs/Bytecode/%s.bc' % self.tapes[tape]
+            res = self.decoded[tape] = [
+                (t, get_handler(t), size, args, formats)
+                for t, size, args, formats in bytecode.read_raw(filename)]
+            return res
+
+    def next_input(self, player, thread):
+        """ Next input token of a player in a thread. """
+        try:
+            tokens = self.inputs[player, thread]
+        except KeyError:
+            filename = '%s-P%d-%d' % (self.input_prefix, player, thread)
+            try:
+                with open(filename) as f:
+                    tokens = iter(f.read().split())
+            except OSError:
+                tokens = iter(())
+            self.inputs[player, thread] = tokens
+        try:
+            return next(tokens)
+        except StopIteration:
+            raise InterpreterError('not enough inputs in %s-P%d-%d' % (
+                self.input_prefix, player, thread))
+
+    def print_vector(self, strings):
+        strings = list(strings)
+        if len(strings) == 1:
+            res = strings[0]
+        else:
+            res = '[%s]' % ', '.join(strings)
+        self.out.extend(res.encode())
+
+    def run(self):
+        """ Execute the program.
+
+        :returns: output of party 0 (str)"""
+        Processor(self, 0).run()
+        return self.out.decode(errors='replace')
@@ -849,12 +849,20 @@ def map_reduce_single(n_parallel, n_loops, initializer=lambda *x: [],
                 block = get_block()
                 assert not isinstance(n_loops, int) or n_loops > 0
                 pre = copy.copy(loop_body.__globals__)
+                tuner = get_program().autotuner
+                start = len(block)
+                limit = None
                 while (not util.is_constant(n_loops) or k < n_loops) \
-                      and (len(get_block()) < budget or k == 0) \
+                      and (k == 0 or (len(get_block()) < budget
+                                      if limit is None else k < limit)) \
                       and block is get_block():
                     j = i + k
                     state = reducer(tuplify(loop_body(j)), state)
                     k += 1
+                    if tuner and k == 1 and block is get_block():
+                        limit = tuner.choose(
+                            block.instructions[start:], n_loops, budget,
+                            get_program())
                 RegintOptimizer().run(block.instructions, get_program())
                 _link(pre, loop_body.__globals__)
                 r = reducer(mem_state, state)
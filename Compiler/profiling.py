@@ -0,0 +1,254 @@
+"""
+This module measures the time and memory spent in the phases of the
+compilation, which helps to find the phase responsible for a slow
+compilation and to track regressions. The following phases are
+distinguished:
+
+- ``tracing``: running the high-level code, which creates the
+  instructions
+- ``dependency_graph``: building the dependency graph of a basic block
+  (:py:class:`Compiler.allocator.Merger`)
+- ``eliminate_dead_code``, ``longest_paths_merge``: dead code
+  elimination and merging of communication rounds per basic block
+- ``expand_cisc``: expanding complex instructions per tape
+- ``allocate_registers``: register allocation per basic block
+- ``add_requirements``: aggregating the preprocessing requirements per
+  tape
+- ``write_bytes``: writing the bytecode per tape
+
+Phases can be nested, for example a tape might be optimized during the
+tracing of the following tape. The time of a phase therefore excludes
+the time of nested phases, so that the times add up to the total.
+Phases run in a child process with ``--jobs`` are reported as well,
+which means that the sum can exceed the wall time.
+
+By default, the memory of a phase is how much it increased the peak
+resident set size of the process, which is cheap to measure but only
+shows the phases that raise the overall high-water mark. With
+``--profile-memory``, the memory is the high-water mark of the memory
+allocated by Python during a phase relative to the start of the phase
+as reported by :py:mod:`tracemalloc`, which slows down the compilation
+considerably.
+
+Enable the profiling with ``--profile-phases`` or ``--profile-json
+FILE``, which writes the report as JSON.
+"""
+
+import collections
+import contextlib
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+VERSION = 1
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes (0 if
+    unknown)."""
+    if resource is None:
+        return 0
+    res = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes except on macOS
+    return res if sys.platform == 'darwin' else res * 1024
+
+
+class PhaseStats:
+    """Accumulated statistics of a phase."""
+
+    __slots__ = 'calls', 'time', 'memory', 'instructions'
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0
+        self.memory = 0
+        self.instructions = 0
+
+    def add(self, other):
+        self.calls += other.calls
+        self.time += other.time
+        self.memory = max(self.memory, other.memory)
+        self.instructions += other.instructions
+
+    def to_json(self):
+        return dict(calls=self.calls, time=self.time, memory=self.memory,
+                    instructions=self.instructions)
+
+    @classmethod
+    def from_json(cls, data):
+        res = cls()
+        for key in cls.__slots__:
+            setattr(res, key, data[key])
+        return res
+
+
+class Frame:
+    __slots__ = 'start', 'nested', 'start_memory', 'peak'
+
+    def __init__(self, start, memory):
+        self.start = start
+        self.nested = 0
+        self.start_memory = self.peak = memory
+
+
+class PhaseProfiler:
+    """Collects the time and memory per phase, tape, and basic block.
+
+    :param block_threshold: minimum number of instructions for a basic
+      block to be listed on its own, smaller blocks are only included
+      in the tape total
+    :param memory: whether to trace memory allocations instead of
+      using the peak resident set size
+    """
+
+    def __init__(self, block_threshold=10000, memory=False):
+        self.block_threshold = block_threshold
+        self.memory = memory
+        # (tape, block) -> phase -> stats, None for the whole program
+        self.stats = collections.defaultdict(
+            lambda: collections.defaultdict(PhaseStats))
+        self.stack = []
+        self.start = time.perf_counter()
+        self.peak_memory = 0
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def get_memory(self):
+        """Update the peak of the enclosing phase and return the current
+        memory usage."""
+        if not self.memory:
+            return peak_rss()
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak_memory = max(self.peak_memory, peak)
+        if self.stack:
+            self.stack[-1].peak = max(self.stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @contextlib.contextmanager
+    def phase(self, name, tape=None, block=None):
+        """Context manager for measuring a phase.
+
+        :param name: name of the phase
+        :param tape: tape (None for the whole program)
+        :param block: basic block (None for the whole tape)
+        """
+        frame = Frame(None, self.get_memory())
+        self.stack.append(frame)
+        frame.start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - frame.start
+            frame.peak = max(frame.peak, self.get_memory())
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1].nested += elapsed
+                self.stack[-1].peak = max(self.stack[-1].peak, frame.peak)
+            n_instructions = 0 if block is None else len(block.instructions)
+            if block is None or n_instructions < self.block_threshold:
+                key = None if tape is None else (tape.name, None)
+            else:
+                key = tape.name, block.name
+            stats = self.stats[key][name]
+            stats.calls += 1
+            stats.time += elapsed - frame.nested
+            stats.memory = max(stats.memory, frame.peak - frame.start_memory)
+            stats.instructions += n_instructions
+
+    def reset(self):
+        """Forget all statistics, for example in a child process."""
+        self.stats.clear()
+
+    def export(self):
+        """Statistics for :py:func:`merge` in another process."""
+        return [[key, {name: stats.to_json() for name, stats in phases.items()}]
+                for key, phases in self.stats.items()]
+
+    def merge(self, exported):
+        """Add statistics from :py:func:`export`."""
+        for key, phases in exported:
+            key = None if key is None else tuple(key)
+            for name, stats in phases.items():
+                self.stats[key][name].add(PhaseStats.from_json(stats))
+
+    def totals(self, key=None):
+        """Statistics per phase, either overall or for one tape including
+        its blocks."""
+        res = collections.defaultdict(PhaseStats)
+        for k, phases in self.stats.items():
+            if key is None or (k is not None and k[0] == key):
+                for name, stats in phases.items():
+                    res[name].add(stats)
+        return res
+
+    def tape_names(self):
+        return list(dict.fromkeys(key[0] for key in self.stats if key))
+
+    def to_json(self, program_name=None):
+        """Report as JSON-compatible dictionary."""
+        def phases(stats):
+            return {name: x.to_json() for name, x in stats.items()}
+
+        res = dict(version=VERSION, program=program_name,
+                   total_time=time.perf_counter() - self.start,
+                   phases=phases(self.totals()))
+        res['memory_source'] = 'tracemalloc' if self.memory else 'rss'
+        if self.memory:
+            res['peak_memory'] = max(self.peak_memory,
+                                     tracemalloc.get_traced_memory()[1])
+        else:
+            res['peak_memory'] = peak_rss()
+        res['tapes'] = []
+        for name in self.tape_names():
+            blocks = [dict(name=key[1], phases=phases(stats))
+                      for key, stats in self.stats.items()
+                      if key and key[0] == name and key[1] is not None]
+            res['tapes'].append(dict(name=name,
+                                     phases=phases(self.totals(name)),
+                                     blocks=blocks))
+        return res
+
+    def write_json(self, filename, program_name=None):
+        with open(filename, 'w') as f:
+            json.dump(self.to_json(program_name), f, indent=1)
+            f.write('\n')
+
+    def table(self, program_name=None):
+        """Report as human-readable table."""
+        report = self.to_json(program_name)
+        total = sum(x['time'] for x in report['phases'].values()) or 1
+        lines = []
+
+        def add_rows(title, phases):
+            if len(title) > 24:
+                lines.append(title)
+                title = ''
+            for name, x in sorted(phases.items(), key=lambda x: -x[1]['time']):
+                lines.append('%-24s %-22s %9.3f %5.1f%% %6d %10s %9.1f' % (
+                    title, name, x['time'], 100 * x['time'] / total,
+                    x['calls'], x['instructions'] or '-',
+                    x['memory'] / 2 ** 20))
+                title = ''
+
+        lines.append('%-24s %-22s %9s %6s %6s %10s %9s' % (
+            'Tape/block', 'Phase', 'Time (s)', '', 'Calls', 'Instr.',
+            'Mem (MB)'))
+        add_rows('total', report['phases'])
+        if None in self.stats:
+            add_rows('program', {name: x.to_json() for name, x in
+                                 self.stats[None].items()})
+        for tape in report['tapes']:
+            add_rows(tape['name'], tape['phases'])
+            for block in tape['blocks']:
+                add_rows('  ' + block['name'], block['phases'])
+        lines.append('Wall time: %.3f s' % report['total_time'])
+        lines.append('Peak memory (%s): %.1f MB' % (
+            report['memory_source'], report['peak_memory'] / 2 ** 20))
+        return '\n'.join(lines)
@@ -4,14 +4,17 @@ blocks and registers. Most relevant is the central :py:class:`Program`
 object that holds various properties of the computation.
 """
 
+import contextlib
 import inspect
 import itertools
 import math
 import os
+import pickle
 import re
 import sys
 import hashlib
 import random
+import traceback
 from collections import defaultdict, deque
 from functools import reduce
 
@@ -132,6 +135,7 @@ class Program(object):
         self.tape_stack = []
         self.n_threads = 1
         self.public_input_file = None
+        self.public_input_filename = None
         self.types = {}
         if self.options.budget:
             self.budget = int(self.options.budget)
@@ -140,37 +144,7 @@ class Program(object):
                 self.budget = 100000
             else:
                 self.budget = defaults.budget
-        self.to_merge = [
-            Compiler.instructions.asm_open_class,
-            Compiler.instructions.gasm_open_class,
-            Compiler.instructions.muls_class,
-            Compiler.instructions.gmuls_class,
-            Compiler.instructions.mulrs_class,
-            Compiler.instructions.gmulrs,
-            Compiler.instructions.dotprods_class,
-            Compiler.instructions.gdotprods_class,
-            Compiler.instructions.asm_input_class,
-            Compiler.instructions.gasm_input_class,
-            Compiler.instructions.inputfix_class,
-            Compiler.instructions.inputfloat_class,
-            Compiler.instructions.inputmixed_class,
-            Compiler.instructions.trunc_pr_class,
-            Compiler.instructions_base.Mergeable,
-        ]
-        import Compiler.GC.instructions as gc
-
-        self.to_merge += [
-            gc.ldmsdi,
-            gc.stmsdi,
-            gc.ldmsd,
-            gc.stmsd,
-            gc.stmsdci,
-            gc.andrs,
-            gc.ands,
-            gc.inputb,
-            gc.inputbvec,
-            gc.reveal,
-        ]
+        self.to_merge = self.default_merge_classes()
         self.use_trunc_pr = False
         """ Setting whether to use special probabilistic truncation. """
         self.use_dabit = options.mixed
@@ -195,6 +169,25 @@ class Program(object):
         self.active = True
         self.prevent_breaks = False
         self.cisc_to_function = True
+        self.n_jobs = int(getattr(options, "jobs", None) or 1)
+        self.tape_jobs = []
+        self.template_cache = None
+        if getattr(options, "template_cache", None):
+            from .compile_cache import TemplateCache
+
+            self.template_cache = TemplateCache(options.template_cache)
+        self.profiler = None
+        profile_memory = getattr(options, "profile_memory", None)
+        if getattr(options, "profile_phases", None) or \
+           getattr(options, "profile_json", None) or profile_memory:
+            from .profiling import PhaseProfiler
+
+            self.profiler = PhaseProfiler(memory=profile_memory)
+        self.autotuner = None
+        if getattr(options, "autotune", None):
+            from .autotune import UnrollTuner
+
+            self.autotuner = UnrollTuner(options.autotune)
         if not self.options.cisc:
             self.options.cisc = not self.options.optimize_hard
 
@@ -207,6 +200,43 @@ class Program(object):
         comparison.program = self
         comparison.set_variant(options)
 
+    @staticmethod
+    def default_merge_classes():
+        """Instruction classes that are merged to reduce the number of
+        communication rounds."""
+        res = [
+            Compiler.instructions.asm_open_class,
+            Compiler.instructions.gasm_open_class,
+            Compiler.instructions.muls_class,
+            Compiler.instructions.gmuls_class,
+            Compiler.instructions.mulrs_class,
+            Compiler.instructions.gmulrs,
+            Compiler.instructions.dotprods_class,
+            Compiler.instructions.gdotprods_class,
+            Compiler.instructions.asm_input_class,
+            Compiler.instructions.gasm_input_class,
+            Compiler.instructions.inputfix_class,
+            Compiler.instructions.inputfloat_class,
+            Compiler.instructions.inputmixed_class,
+            Compiler.instructions.trunc_pr_class,
+            Compiler.instructions_base.Mergeable,
+        ]
+        import Compiler.GC.instructions as gc
+
+        res += [
+            gc.ldmsdi,
+            gc.stmsdi,
+            gc.ldmsd,
+            gc.stmsd,
+            gc.stmsdci,
+            gc.andrs,
+            gc.ands,
+            gc.inputb,
+            gc.inputbvec,
+            gc.reveal,
+        ]
+        return res
+
     def get_args(self):
         return self.args
 
@@ -406,7 +436,7 @@ class Program(object):
         else:
             sch_file.write("lgp:%s" % req)
         sch_file.write("\n")
-        sch_file.write("opts: %s\n" % " ".join(self.relevant_opts))
+        sch_file.write("opts: %s\n" % " ".join(sorted(self.relevant_opts)))
         sch_file.write("sec:%d\n" % self.used_security)
         sch_file.close()
         h = hashlib.sha256()
@@ -415,14 +445,90 @@ class Program(object):
             h.update(tape.hash)
         print('Hash:', h.hexdigest())
 
+    def phase(self, name, tape=None, block=None):
+        """Context manager for profiling a compilation phase, see
+        :py:mod:`Compiler.profiling`."""
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name, tape, block)
+
     def finalize_tape(self, tape):
         if not tape.purged:
+            if self.n_jobs > 1 and hasattr(os, "fork"):
+                return self.finalize_tape_in_background(tape)
             tape.optimize(self.options)
             tape.write_bytes()
             if self.options.asmoutfile:
                 tape.write_str(self.options.asmoutfile + "-" + tape.name)
             tape.purge()
 
+    def finalize_tape_in_background(self, tape):
+        """Optimize the blocks of a tape here because of side effects
+        on the program, and leave register allocation and writing the
+        bytecode to a child process."""
+        if not tape.optimize_blocks(self.options):
+            tape.write_bytes()
+            tape.purge()
+            return
+        while len(self.tape_jobs) >= self.n_jobs:
+            self.collect_tape_job()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 0
+            if self.profiler:
+                self.profiler.reset()
+            try:
+                tape.allocate_registers(self.options)
+                tape.add_requirements()
+                tape.write_bytes()
+                if self.options.asmoutfile:
+                    tape.write_str(self.options.asmoutfile + "-" + tape.name)
+                result = "ok", dict(size=len(tape), hash=tape.hash,
+                                    req_num=dict(tape.req_num))
+                if self.profiler:
+                    result[1]["profile"] = self.profiler.export()
+            except SystemExit as e:
+                result = "exit", e.code
+            except BaseException:
+                result = "error", traceback.format_exc()
+                status = 1
+            with os.fdopen(write_fd, "wb") as f:
+                pickle.dump(result, f)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+        os.close(write_fd)
+        self.tape_jobs.append((tape, pid, read_fd))
+        tape.purge(retain_usage=False)
+
+    def collect_tape_job(self):
+        tape, pid, read_fd = self.tape_jobs.pop(0)
+        with os.fdopen(read_fd, "rb") as f:
+            data = f.read()
+        os.waitpid(pid, 0)
+        if not data:
+            raise CompilerError("process optimizing %s died" % tape.name)
+        status, result = pickle.loads(data)
+        if status == "exit":
+            sys.exit(result)
+        elif status == "error":
+            raise CompilerError(
+                "optimizing %s failed:\n%s" % (tape.name, result))
+        tape.size = result["size"]
+        tape.hash = result["hash"]
+        tape.req_num = Tape.ReqNum(result["req_num"])
+        tape.req_tree.aggregated = tape.req_num
+        if "profile" in result:
+            self.profiler.merge(result["profile"])
+
+    def collect_tape_jobs(self):
+        while self.tape_jobs:
+            self.collect_tape_job()
+
     @property
     def curr_tape(self):
         """The tape that is currently running."""
@@ -510,6 +616,8 @@ class Program(object):
         self.later_mem_blocks.clear()
 
     def finalize(self):
+        self.collect_tape_jobs()
+
         # optimize the tapes
         for tape in self.tapes:
             tape.optimize(self.options)
@@ -556,9 +664,9 @@ class Program(object):
     def public_input(self, x):
         """Append a value to the public input file."""
         if self.public_input_file is None:
-            self.public_input_file = open(
-                self.programs_dir + "/Public-Input/%s" % self.name, "w"
-            )
+            self.public_input_filename = \
+                self.programs_dir + "/Public-Input/%s" % self.name
+            self.public_input_file = open(self.public_input_filename, "w")
         self.public_input_file.write("%s\n" % str(x))
 
     def get_binary_input_file(self, player):
@@ -967,10 +1075,10 @@ class Tape:
         else:
             return sum(len(block) for block in self.basicblocks)
 
-    def purge(self):
+    def purge(self, retain_usage=True):
         self.size = len(self)
         for block in self.basicblocks:
-            block.purge()
+            block.purge(retain_usage)
         self._is_empty = len(self.basicblocks) == 0
         del self.basicblocks
         del self.active_basicblock
@@ -986,9 +1094,20 @@ class Tape:
 
     @unpurged
     def optimize(self, options):
+        if self.optimize_blocks(options):
+            self.allocate_registers(options)
+            self.add_requirements()
+
+    def optimize_blocks(self, options):
+        """Merge instructions, expand CISC instructions, and add
+        jumps. This has to happen in program order because of side
+        effects on the program.
+
+        :returns: whether the tape is non-empty
+        """
         if len(self.basicblocks) == 0:
             print("Tape %s is empty" % self.name)
-            return
+            return False
 
         if self.if_states:
             print("Tracebacks for open blocks:")
@@ -1023,18 +1142,21 @@ class Tape:
                         )
                     )
                 # the next call is necessary for allocation later even without merging
-                merger = al.Merger(block, options, tuple(self.program.to_merge))
+                with self.program.phase("dependency_graph", self, block):
+                    merger = al.Merger(block, options, tuple(self.program.to_merge))
                 if options.dead_code_elimination:
                     if len(block.instructions) > 1000000:
                         print("Eliminate dead code...")
-                    merger.eliminate_dead_code()
+                    with self.program.phase("eliminate_dead_code", self, block):
+                        merger.eliminate_dead_code()
                 if options.merge_opens and self.merge_opens:
                     if len(block.instructions) == 0:
                         block.used_from_scope = util.set_by_id()
                         continue
                     if len(block.instructions) > 1000000:
                         print("Merging instructions...")
-                    numrounds = merger.longest_paths_merge()
+                    with self.program.phase("longest_paths_merge", self, block):
+                        numrounds = merger.longest_paths_merge()
                     block.n_rounds = numrounds
                     block.n_to_merge = len(merger.open_nodes)
                     if options.verbose:
@@ -1065,7 +1187,8 @@ class Tape:
             print("Not merging instructions in tape %s" % self.name)
 
         if options.cisc:
-            self.expand_cisc()
+            with self.program.phase("expand_cisc", self):
+                self.expand_cisc()
 
         # add jumps
         offset = 0
@@ -1082,8 +1205,10 @@ class Tape:
 
         # now remove any empty blocks (must be done after setting jumps)
         self.basicblocks = [x for x in self.basicblocks if len(x.instructions) != 0]
+        return True
 
-        # allocate registers
+    def allocate_registers(self, options):
+        """Allocate registers. Only depends on the tape itself."""
         reg_counts = self.count_regs()
         if options.noreallocate:
             if self.program.verbose:
@@ -1141,7 +1266,8 @@ class Tape:
                     ):
                         alloc_loop(block.exit_block.scope)
                 usage = allocator.max_usage.copy()
-                allocator.process(block.instructions, block.alloc_pool)
+                with self.program.phase("allocate_registers", self, block):
+                    allocator.process(block.instructions, block.alloc_pool)
                 if self.program.verbose and usage != allocator.max_usage:
                     print("Allocated registers in %s " % block.name, end="")
                     for t, n in allocator.max_usage.items():
@@ -1155,12 +1281,14 @@ class Tape:
                 n_fragments = sum(scope.n_fragments() for scope in scopes)
                 print("%d register fragments in %d scopes" % (n_fragments, len(scopes)))
 
-        # offline data requirements
+    def add_requirements(self):
+        """Compile offline data requirements."""
         if self.program.verbose:
             print("Compile offline data requirements...")
-        for block in self.basicblocks:
-            block.req_node.add_block(block)
-        self.req_num = self.req_tree.aggregate()
+        with self.program.phase("add_requirements", self):
+            for block in self.basicblocks:
+                block.req_node.add_block(block)
+            self.req_num = self.req_tree.aggregate()
         if self.program.verbose:
             print("Tape requires", self.req_num)
         for req, num in sorted(self.req_num.items()):
@@ -1287,14 +1415,11 @@ class Tape:
         if "Bytecode" not in filename:
             filename = self.program.programs_dir + "/Bytecode/" + filename
         print("Writing to", filename)
-        f = open(filename, "wb")
+        from Compiler import bytecode
+
         h = hashlib.sha256()
-        for i in self._get_instructions():
-            if i is not None:
-                b = i.get_bytes()
-                f.write(b)
-                h.update(b)
-        f.close()
+        with self.program.phase("write_bytes", self), open(filename, "wb") as f:
+            bytecode.write(self._get_instructions(), f, h)
         self.hash = h.digest()
 
     def new_reg(self, reg_type, size=None):
@@ -1482,9 +1607,9 @@ class Tape:
 
     @staticmethod
     def read_instructions(tapename):
-        tape = open("Programs/Bytecode/%s.bc" % tapename, "rb")
-        while tape.peek():
-            yield inst_base.ParsedInstruction(tape)
+        from Compiler import bytecode
+
+        return bytecode.read("Programs/Bytecode/%s.bc" % tapename)
 
     class _no_truth(object):
         __slots__ = []
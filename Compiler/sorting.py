@@ -1,14 +1,64 @@
 import itertools
+import math
 from Compiler import types, library, instructions
 
-def dest_comp(B):
-    Bt = B.transpose()
+def dest_comp(B, transposed=False):
+    """ Compute the destinations of a stable sort by bucket.
+
+    :param B: Matrix of sint with one row per element and one one-hot
+      column per bucket
+    :param transposed: whether :py:obj:`B` has one row per bucket
+      instead
+    :returns: vector of sint containing the destination of every element
+
+    """
+    Bt = B if transposed else B.transpose()
     St_flat = Bt.get_vector().prefix_sum()
     Tt_flat = Bt.get_vector() * St_flat.get_vector()
     Tt = types.Matrix(*Bt.sizes, B.value_type)
     Tt.assign_vector(Tt_flat)
     return sum(Tt) - 1
 
+def one_hot(bits):
+    """ One-hot encoding of digits given by their bits.
+
+    :param bits: list of sint vectors of equal length, least significant
+      bit first
+    :returns: Matrix with one row per digit value (:math:`2^d` for
+      :math:`d` bits) and one column per element, for use with
+      ``dest_comp(B, transposed=True)``
+
+    """
+    B = types.sint.Matrix(2 ** len(bits), len(bits[0]))
+    B.assign_vector(one_hot_vector(bits))
+    return B
+
+def one_hot_vector(bits):
+    """ Same as :py:func:`one_hot` but as vector with one part per digit
+    value. """
+    res = types.sint.concat([1 - bits[0], bits[0]])
+    for i, b in enumerate(bits[1:], 1):
+        y = res * types.sint.concat([b] * 2 ** i)
+        res = types.sint.concat([res - y, y])
+    return res
+
+def default_digit_bits(n, n_bits):
+    """ Heuristic for the number of bits per digit in radix sort. Every
+    pass uses three secure shuffles, each of which is assumed to cost as
+    much as :math:`\log_2 n` multiplications per element, and
+    :math:`2^{d+1} - 2` multiplications per element for computing the
+    destinations of :math:`d`-bit digits.
+
+    :param n: number of elements
+    :param n_bits: number of key bits
+    :returns: bits per digit (int)
+
+    """
+    shuffle_cost = 3 * math.log2(max(n, 2))
+    def cost(d):
+        return math.ceil(n_bits / d) * (shuffle_cost + 2 ** (d + 1) - 2)
+    return min(range(1, min(n_bits, 8) + 1), key=cost)
+
 def reveal_sort(k, D, reverse=False):
     """ Sort in place according to "perfect" key. The name hints at the fact
     that a random order of the keys is revealed.
@@ -37,37 +87,269 @@ def reveal_sort(k, D, reverse=False):
     library.break_point()
     instructions.delshuffle(shuffle)
 
-def radix_sort(k, D, n_bits=None, signed=True):
+def radix_sort(k, D, n_bits=None, signed=True, digit_bits=None,
+               n_threads=None):
     """ Sort in place according to key.
 
     :param k: keys (vector or Array of sint or sfix)
     :param D: Array or MultiArray to sort
     :param n_bits: number of bits in keys (int)
     :param signed: whether keys are signed (bool)
+    :param digit_bits: number of key bits per pass (default: heuristic)
+    :param n_threads: number of threads for the bit decomposition and
+      the computation of destinations (default: single thread)
 
     """
     assert len(k) == len(D)
-    bs = types.Matrix.create_from(k.get_vector().bit_decompose(n_bits))
-    if signed and len(bs) > 1:
-        bs[-1][:] = bs[-1][:].bit_not()
-    radix_sort_from_matrix(bs, D)
+    if not n_threads or n_threads == 1:
+        bs = types.Matrix.create_from(k.get_vector().bit_decompose(n_bits))
+        if signed and len(bs) > 1:
+            bs[-1][:] = bs[-1][:].bit_not()
+        radix_sort_from_matrix(bs, D, digit_bits=digit_bits)
+        return
+    if not isinstance(k, types.Array):
+        k = types.Array.create_from(k)
+    n = len(k)
+    n_bits = n_bits or getattr(k.value_type, 'k', None) or \
+        library.get_program().bit_length
+    digits = digit_matrix(n, n_bits, digit_bits)
+    @library.multithread(n_threads, n)
+    def _(base, size):
+        bits = k.get_vector(base, size).bit_decompose(n_bits)
+        if signed and len(bits) > 1:
+            bits[-1] = bits[-1].bit_not()
+        store_digits(digits, bits, base)
+    radix_sort_from_digits(digits, D, n_threads=n_threads)
 
-def radix_sort_from_matrix(bs, D):
-    n = len(D)
+def digit_matrix(n, n_bits, digit_bits=None):
+    """ Storage for the digits of :py:obj:`n` keys, one Matrix with one
+    row per element for every pass. The number of bits per digit is
+    adjusted so that all passes use the same number of bits with as
+    little padding as possible. """
+    d = digit_bits or default_digit_bits(n, n_bits)
+    n_passes = -(-n_bits // d)
+    d = -(-n_bits // n_passes)
+    return types.MultiArray([n_passes, n, d], types.sint)
+
+def store_digits(digits, bits, base=0):
+    """ Store bits of consecutive elements in the output of
+    :py:func:`digit_matrix`, padding with zero bits.
+
+    :param bits: list of sint vectors, least significant first
+    :param base: index of first element (regint/cint/int)
+
+    """
+    n_passes, n, d = digits.sizes
+    size = len(bits[0])
+    for i in range(n_passes * d):
+        bit = bits[i] if i < len(bits) else types.sint(0, size=size)
+        addresses = types.regint.inc(
+            size, digits[i // d].address + base * d + i % d, d)
+        bit.store_in_mem(addresses)
+
+def radix_sort_from_matrix(bs, D=None, digit_bits=None):
+    """ Sort in place according to bit-decomposed key. Every pass sorts
+    by a digit of several bits using one bucket per digit value, which
+    reduces the number of secure shuffles.
+
+    :param bs: Matrix of bits, least significant first, one row per bit
+    :param D: Array or MultiArray to sort (optional)
+    :param digit_bits: number of bits per pass (default: see
+      :py:func:`default_digit_bits`)
+    :returns: Array :py:obj:`h` of sint such that the :py:obj:`j`-th
+      sorted element was at position :py:obj:`h[j]` before sorting. Use
+      ``reveal_sort(h, X, reverse=False)`` to undo the sort on :py:obj:`X`.
+
+    """
+    n = len(bs[0]) if D is None else len(D)
     for b in bs:
         assert(len(b) == n)
-    B = types.sint.Matrix(n, 2)
+    digits = digit_matrix(n, len(bs), digit_bits)
+    store_digits(digits, [b.get_vector() for b in bs])
+    return radix_sort_from_digits(digits, D)
+
+def dest_comp_multithread(digit, n_threads):
+    """ Destinations for a pass of radix sort computed in several
+    threads with the same result as :py:func:`dest_comp`.
+
+    :param digit: Matrix of sint with one row of bits per element
+    :param n_threads: number of threads (int)
+    :returns: Array of sint
+
+    """
+    n, d = digit.sizes
+    # registers cannot be used across threads
+    bits = types.sint.Matrix(n, d)
+    bits.assign(digit)
+    B = types.sint.Matrix(2 ** d, n)
+    S = types.sint.Matrix(2 ** d, n)
+    res = types.sint.Array(n)
+    @library.multithread(n_threads, n)
+    def _(base, size):
+        part = one_hot_vector([types.sint.load_mem(types.regint.inc(
+            size, bits.address + base * d + j, d)) for j in range(d)])
+        for j in range(2 ** d):
+            B[j].assign_vector(part.get_vector(j * size, size), base)
+    S.assign_vector(B.get_vector().prefix_sum())
+    @library.multithread(n_threads, n)
+    def _(base, size):
+        res.assign_vector(sum(B[j].get_vector(base, size) *
+                              S[j].get_vector(base, size)
+                              for j in range(2 ** d)) - 1, base)
+    return res
+
+def radix_sort_from_digits(digits, D=None, n_threads=None):
+    """ Sort in place according to the digits in the output of
+    :py:func:`digit_matrix`. See :py:func:`radix_sort_from_matrix` for
+    the other parameters and the output.
+
+    :param n_threads: number of threads for computing the destinations
+      in every pass (default: single thread)
+
+    """
+    n_passes, n, d = digits.sizes
     h = types.Array.create_from(types.sint(types.regint.inc(n)))
-    @library.for_range(len(bs))
+    @library.for_range(n_passes)
     def _(i):
-        b = bs[i]
-        B.set_column(0, 1 - b.get_vector())
-        B.set_column(1, b.get_vector())
-        c = types.Array.create_from(dest_comp(B))
+        if n_threads and n_threads > 1:
+            c = dest_comp_multithread(digits[i], n_threads)
+        else:
+            digit = digits[i]
+            B = one_hot([digit.get_column(j) for j in range(d)])
+            c = types.Array.create_from(dest_comp(B, transposed=True))
         reveal_sort(c, h, reverse=False)
-        @library.if_e(i < len(bs) - 1)
-        def _():
-            reveal_sort(h, bs[i + 1], reverse=True)
-        @library.else_
+        @library.if_(i < n_passes - 1)
         def _():
-            reveal_sort(h, D, reverse=True)
+            reveal_sort(h, digits[i + 1], reverse=True)
+    if D is not None:
+        reveal_sort(h, D, reverse=True)
+    return h
+
+class SortPermutation:
+    """ Permutation that sorts according to keys. It is computed once
+    and can then be applied to any number of containers. The secure
+    shuffle needed for the application is generated on first use, and
+    all containers in one call of :py:func:`apply` or
+    :py:func:`unapply` are permuted with a single shuffle. For example,
+    the following sorts the columns of a table by the first column::
+
+        perm = SortPermutation(table[0])
+        perm.apply(*table)
+
+    :param keys: vector or Array of sint or sfix, or a list of them
+      with the most significant key first
+    :param n_bits: number of bits per key (int or list, default: global
+      bit length)
+    :param signed: whether keys are signed (bool)
+    :param digit_bits: number of key bits per pass (default: heuristic)
+
+    """
+    def __init__(self, keys, n_bits=None, signed=True, digit_bits=None):
+        if not isinstance(keys, (list, tuple)):
+            keys = [keys]
+        if not isinstance(n_bits, (list, tuple)):
+            n_bits = [n_bits] * len(keys)
+        bs = []
+        for k, nb in reversed(list(zip(keys, n_bits))):
+            assert len(k) == len(keys[0])
+            k_bits = k.get_vector().bit_decompose(nb)
+            if signed and len(k_bits) > 1:
+                k_bits[-1] = k_bits[-1].bit_not()
+            bs += k_bits
+        self.perm = radix_sort_from_matrix(types.Matrix.create_from(bs),
+                                           digit_bits=digit_bits)
+        self.shuffle = None
+        self.idx = None
+
+    def __len__(self):
+        return len(self.perm)
+
+    def prepare(self):
+        """ Generate the shuffle and reveal the shuffled permutation
+        unless done before. This is done automatically on first use,
+        which must not happen in a run-time branch. """
+        if self.shuffle is None:
+            library.break_point()
+            shuffle = types.sint.get_secure_shuffle(len(self))
+            self.shuffle = types.MemValue(shuffle)
+            self.idx = types.Array.create_from(
+                self.perm.get_vector().secure_permute(shuffle).reveal())
+
+    def pack(self, containers):
+        """ Matrix with one row per element containing all columns of
+        the containers, or the container itself if there is only one. """
+        if len(containers) == 1:
+            return containers[0]
+        widths = [x.part_size() if isinstance(x, types.SubMultiArray)
+                  else 1 for x in containers]
+        res = types.sint.Matrix(len(self), sum(widths))
+        i = 0
+        for x, width in zip(containers, widths):
+            for j in range(width):
+                if width == 1 and not isinstance(x, types.SubMultiArray):
+                    v = x.get_vector()
+                else:
+                    v = x.get_column(j)
+                res.set_column(i, v.v if isinstance(v, types._fix) else v)
+                i += 1
+        return res
+
+    def unpack(self, packed, containers):
+        if len(containers) == 1:
+            return
+        i = 0
+        for x in containers:
+            def get():
+                v = packed.get_column(i)
+                if issubclass(x.value_type, types._fix):
+                    v = x.value_type._new(v)
+                return v
+            if isinstance(x, types.SubMultiArray):
+                for j in range(x.part_size()):
+                    x.set_column(j, get())
+                    i += 1
+            else:
+                x.assign_vector(get())
+                i += 1
+
+    def permute(self, args, reverse):
+        containers = [x if isinstance(x, (types.Array, types.SubMultiArray))
+                      else types.Array.create_from(x) for x in args]
+        for x in containers:
+            assert len(x) == len(self)
+            assert x.value_type.n_elements() == 1
+        self.prepare()
+        D = self.pack(containers)
+        if reverse:
+            D.assign_vector(D.get_slice_vector(self.idx))
+            library.break_point()
+            D.secure_permute(self.shuffle, reverse=True)
+        else:
+            D.secure_permute(self.shuffle)
+            library.break_point()
+            D.assign_slice_vector(self.idx, D.get_vector())
+        library.break_point()
+        self.unpack(D, containers)
+        return containers[0] if len(containers) == 1 else containers
+
+    def apply(self, *args):
+        """ Sort according to the keys.
+
+        :param args: Arrays or Matrices of sint or sfix to sort in
+          place (rows in the case of Matrices), or vectors
+        :returns: the containers, where vectors are replaced by new
+          Arrays (a single container if only one is given)
+
+        """
+        return self.permute(args, True)
+
+    def unapply(self, *args):
+        """ Undo the sort. See :py:func:`apply` for the parameters. """
+        return self.permute(args, False)
+
+    def delete(self):
+        """ Free the shuffle in the virtual machine. Using the
+        permutation afterwards generates a new one. """
+        if self.shuffle is not None:
+            instructions.delshuffle(self.shuffle.read())
+            self.shuffle = None
@@ -6308,7 +6308,8 @@ class Array(_vectorizable):
         n)^2)` for :py:class:`sfloat`.
 
         :param n_threads: number of threads to use (single thread by
-          default), need to use Batcher's algorithm for several threads
+          default), radix sort uses them for the bit decomposition and
+          the computation of destinations but not for the shuffling
         :param batcher: use Batcher's odd-even mergesort in any case
         :param n_bits: number of bits in keys (default: global bit length)
         """
@@ -6316,11 +6317,8 @@ class Array(_vectorizable):
            program.options.binary:
             library.loopy_odd_even_merge_sort(self, n_threads=n_threads)
         else:
-            if n_threads or 1 > 1:
-                raise CompilerError('multi-threaded sorting only implemented '
-                                    'with Batcher\'s odd-even mergesort')
             from . import sorting
-            sorting.radix_sort(self, self, n_bits=n_bits)
+            sorting.radix_sort(self, self, n_bits=n_bits, n_threads=n_threads)
 
     def to_row_matrix(self):
         """
@@ -7112,8 +7110,14 @@ class SubMultiArray(_vectorizable):
 
         :param permutation: output of :py:func:`sint.get_secure_shuffle()`
         :param reverse: whether to apply inverse (default: False)
+        :param n_threads: number of threads to permute columns in
+          parallel (default: all columns at once)
 
         """
+        if n_threads is None and self.value_type.n_elements() == 1:
+            self.assign_vector(self.get_vector().secure_permute(
+                permutation, unit_size=self.part_size(), reverse=reverse))
+            return
         if n_threads is not None:
             permutation = MemValue(permutation)
         @library.for_range_multithread(n_threads, 1, self.get_part_size())
@@ -7121,7 +7125,7 @@ class SubMultiArray(_vectorizable):
             self.set_column(i, self.get_column(i).secure_permute(
                 permutation, reverse=reverse))
 
-    def sort(self, key_indices=None, n_bits=None):
+    def sort(self, key_indices=None, n_bits=None, n_threads=None):
         """ Sort sub-arrays (different first index) in place.
         This uses `radix sort <https://eprint.iacr.org/2014/121>`_.
 
@@ -7129,6 +7133,8 @@ class SubMultiArray(_vectorizable):
           ``(1, 2)`` to sort three-dimensional array ``a`` by keys
           ``a[*][1][2]``. Default is ``(0, ..., 0)`` of correct length.
         :param n_bits: number of bits in keys (default: global bit length)
+        :param n_threads: number of threads (default: single thread),
+          see :py:func:`Array.sort`
 
         """
         if key_indices is None:
@@ -7143,7 +7149,7 @@ class SubMultiArray(_vectorizable):
         key_indices = (None,) + util.tuplify(key_indices)
         from . import sorting
         keys = self.get_vector_by_indices(*key_indices)
-        sorting.radix_sort(keys, self, n_bits=n_bits)
+        sorting.radix_sort(keys, self, n_bits=n_bits, n_threads=n_threads)
 
     def randomize(self, *args, n_threads=None):
         """ Randomize according to data type.
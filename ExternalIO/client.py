@@ -1,6 +1,11 @@
+import asyncio
+import collections
+import contextlib
+import itertools
 import platform
 import socket, ssl
 import struct
+import threading
 import time
 from domains import *
 
@@ -30,13 +35,76 @@ def set_keepalive_osx(sock, after_idle_sec=1, interval_sec=3, max_fails=5):
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
     sock.setsockopt(socket.IPPROTO_TCP, TCP_KEEPALIVE, interval_sec)
 
+def set_keepalive(sock):
+    if platform.system() == "Linux":
+        set_keepalive_linux(sock)
+    elif platform.system() == "Darwin":
+        set_keepalive_osx(sock)
+
+def client_context(my_client_id):
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
+    name = 'C%d' % my_client_id
+    prefix = 'Player-Data/%s' % name
+    ctx.load_cert_chain(certfile=prefix + '.pem', keyfile=prefix + '.key')
+    ctx.load_verify_locations(capath='Player-Data')
+    return ctx
+
+def read_domains(specification):
+    """ Secret and clear domain from the specification sent by the
+    first party. """
+    type = specification.get_int(4)
+    if type == ord('R'):
+        domain = Z2(specification.get_int(4))
+        return domain, Z2(specification.get_int(4))
+    elif type == ord('p'):
+        domain = Fp(specification.get_bigint())
+        return domain, domain
+    else:
+        raise Exception('invalid type')
+
+def reconstruct_triples(T, n, streams):
+    """ Reconstruct :py:obj:`n` triples from the octetStreams received
+    from all parties and return the components as lists of
+    integers. Only the first component is sent with passive
+    security. """
+    res = None
+    for party, os in enumerate(streams):
+        if party == 0:
+            active = os.get_length() == 3 * n * T.size()
+        n_expected = 3 if active else 1
+        if os.get_length() != n_expected * T.size() * n:
+            import sys
+            print (os.get_length(), n_expected, T.size(), n, active, file=sys.stderr)
+            raise Exception('unexpected data length')
+        shares = T.unpack_vectors(os, n, n_expected)
+        if res is None:
+            res = shares
+        else:
+            res = [T.add_vectors(a, b) for a, b in zip(res, shares)]
+    res = [T.reduce_vector(a) for a in res]
+    if active and not T.valid_triples(*res):
+        modulus = T.modulus
+        for a, b, c in zip(*(T.to_list(x) for x in res)):
+            prod = a * b % modulus
+            if prod != c:
+                raise Exception(
+                    'invalid triple, diff %s' % hex(prod - c))
+    return [T.to_list(a) for a in res]
+
+def mask_inputs(T, values, masks):
+    assert len(values) == len(masks)
+    os = octetStream()
+    T.pack_many([int(round(value)) + mask
+                 for value, mask in zip(values, masks)], os)
+    return os
+
 class Client:
-    def __init__(self, hostnames, port_base, my_client_id):
-        ctx = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
-        name = 'C%d' % my_client_id
-        prefix = 'Player-Data/%s' % name
-        ctx.load_cert_chain(certfile=prefix + '.pem', keyfile=prefix + '.key')
-        ctx.load_verify_locations(capath='Player-Data')
+    def __init__(self, hostnames, port_base, my_client_id, pool=None):
+        if pool:
+            ctx = pool.context(my_client_id)
+        else:
+            ctx = client_context(my_client_id)
+        self.my_client_id = my_client_id
 
         self.sockets = []
         for i, hostname in enumerate(hostnames):
@@ -50,68 +118,404 @@ class Client:
                         time.sleep(1)
                     else:
                         raise
-                    
-            if platform.system() == "Linux":
-                set_keepalive_linux(plain_socket)
-            elif platform.system() == "Darwin":
-                set_keepalive_osx(plain_socket)
+
+            set_keepalive(plain_socket)
 
             octetStream(b'%d' % my_client_id).Send(plain_socket)
+            if pool:
+                session = pool.sessions.get((my_client_id, i))
+            else:
+                session = None
             self.sockets.append(ctx.wrap_socket(plain_socket,
-                                                server_hostname='P%d' % i))
+                                                server_hostname='P%d' % i,
+                                                session=session))
+            if pool:
+                pool.sessions[my_client_id, i] = self.sockets[-1].session
 
         self.specification = octetStream()
         self.specification.Receive(self.sockets[0])
-        type = self.specification.get_int(4)
-        if type == ord('R'):
-            self.domain = Z2(self.specification.get_int(4))
-            self.clear_domain = Z2(self.specification.get_int(4))
-        elif type == ord('p'):
-            self.domain = Fp(self.specification.get_bigint())
-            self.clear_domain = self.domain
+        if pool:
+            self.domain, self.clear_domain = pool.read_domains(
+                self.specification)
         else:
-            raise Exception('invalid type')
+            self.domain, self.clear_domain = read_domains(self.specification)
 
-    def receive_triples(self, T, n):
-        triples = [[0, 0, 0] for i in range(n)]
-        os = octetStream()
+    def close(self):
         for socket in self.sockets:
-            os.Receive(socket)
-            if socket == self.sockets[0]:
-                active = os.get_length() == 3 * n * T.size()
-            n_expected = 3 if active else 1
-            if os.get_length() != n_expected * T.size() * n:
-                import sys
-                print (os.get_length(), n_expected, T.size(), n, active, file=sys.stderr)
-                raise Exception('unexpected data length')
-            for triple in triples:
-                for i in range(n_expected):
-                    t = T()
-                    t.unpack(os)
-                    triple[i] += t
-        res = []
-        if active:
-            for triple in triples:
-                prod = triple[0] * triple[1]
-                if prod != triple[2]:
-                    raise Exception(
-                        'invalid triple, diff %s' % hex(prod.v - triple[2].v))
-        return triples
+            socket.close()
+        self.sockets = []
+
+    def is_connected(self):
+        """ Whether no party has closed the connection, checked
+        without consuming data. """
+        for sock in self.sockets:
+            try:
+                # peek at the raw TLS stream
+                sock.setblocking(False)
+                if socket.socket.recv(sock, 1, socket.MSG_PEEK) == b'':
+                    return False
+            except BlockingIOError:
+                pass
+            except OSError:
+                return False
+            finally:
+                sock.setblocking(True)
+        return bool(self.sockets)
+
+    def receive_triple_values(self, T, n):
+        def streams():
+            os = octetStream()
+            for socket in self.sockets:
+                os.Receive(socket)
+                yield os
+        return reconstruct_triples(T, n, streams())
+
+    def receive_triples(self, T, n):
+        res = self.receive_triple_values(T, n)
+        res += [[0] * n] * (3 - len(res))
+        return [[T(x) for x in triple] for triple in zip(*res)]
 
     def send_private_inputs(self, values):
         T = self.domain
-        triples = self.receive_triples(T, len(values))
-        os = octetStream()
-        assert len(values) == len(triples)
-        for value, triple in zip(values, triples):
-            (T(value) + triple[0]).pack(os)
+        masks = self.receive_triple_values(T, len(values))[0]
+        os = mask_inputs(T, values, masks)
         for socket in self.sockets:
             os.Send(socket)
 
     def receive_outputs(self, n):
         T = self.domain
-        triples = self.receive_triples(T, n)
-        return [int(self.clear_domain(triple[0].v)) for triple in triples]
+        values = self.receive_triple_values(T, n)[0]
+        return self.clear_domain.int_many(values)
+
+    def send_input_stream(self, values, batch_size, padding=0):
+        """ Send values from an iterable in batches of
+        :py:obj:`batch_size`, one round each. The last batch is padded
+        with :py:obj:`padding`.
+
+        This is not pipelined: the triples for a batch are only
+        received once the previous batch has been sent, because a TLS
+        socket cannot be read and written from two threads at the
+        same time. Use :py:meth:`AsyncClient.input_session` to receive
+        triples in the background. """
+        for batch in batches(values, batch_size):
+            batch += [padding] * (batch_size - len(batch))
+            self.send_private_inputs(batch)
+
+class ClientPool:
+    """ Connected clients to reuse across jobs on a server that keeps
+    client connections open, for example by accepting them once and
+    serving jobs in a loop. The certificates are loaded once per
+    client id, TLS sessions are resumed when reconnecting, and the
+    domain specification is parsed only once. Servers accept one
+    connection per client id at a time, so the pool holds at most one
+    connection per id.
+
+    :param hostnames: hostnames of the parties
+    :param port_base: port of the first party
+    :param client_ids: client ids to use
+
+    Use as follows::
+
+        pool = ClientPool(hostnames, 14000, range(4))
+        with pool.lease() as client:
+            client.send_private_inputs([x])
+
+    """
+    def __init__(self, hostnames, port_base, client_ids):
+        self.hostnames = hostnames
+        self.port_base = port_base
+        self.contexts = {}
+        self.sessions = {}
+        self.specifications = {}
+        self.idle = collections.deque(client_ids)
+        self.clients = {}
+        self.lock = threading.Condition()
+
+    def context(self, client_id):
+        with self.lock:
+            if client_id not in self.contexts:
+                self.contexts[client_id] = client_context(client_id)
+            return self.contexts[client_id]
+
+    def read_domains(self, specification):
+        key = bytes(specification.buf)
+        with self.lock:
+            if key not in self.specifications:
+                self.specifications[key] = read_domains(specification)
+            return self.specifications[key]
+
+    def acquire(self, client_id=None, timeout=None):
+        """ Connected client for exclusive use until released.
+
+        :param client_id: specific client id (default: any idle)
+        :param timeout: time in seconds to wait for an idle client
+        """
+        with self.lock:
+            if not self.lock.wait_for(
+                    lambda: client_id in self.idle if client_id is not None
+                    else self.idle, timeout):
+                raise TimeoutError('no idle client')
+            if client_id is None:
+                client_id = self.idle.popleft()
+            else:
+                self.idle.remove(client_id)
+            client = self.clients.pop(client_id, None)
+        try:
+            if client is None or not client.is_connected():
+                if client:
+                    client.close()
+                client = Client(self.hostnames, self.port_base, client_id,
+                                pool=self)
+        except:
+            self.release_id(client_id)
+            raise
+        return client
+
+    def release(self, client, discard=False):
+        """ Return a client to the pool. Discarding closes the
+        connection, which is necessary if the communication has been
+        interrupted. """
+        if discard:
+            client.close()
+        else:
+            with self.lock:
+                self.clients[client.my_client_id] = client
+        self.release_id(client.my_client_id)
+
+    def release_id(self, client_id):
+        with self.lock:
+            self.idle.append(client_id)
+            self.lock.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self, client_id=None, timeout=None):
+        """ Context manager for :py:func:`acquire` and
+        :py:func:`release`. The connection is discarded on
+        exceptions. """
+        client = self.acquire(client_id, timeout)
+        try:
+            yield client
+        except:
+            self.release(client, discard=True)
+            raise
+        self.release(client)
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients = {}
+
+class AsyncClient:
+    """ Client talking to all parties concurrently using :py:mod:`asyncio`.
+
+    :param hostnames: hostnames of the parties
+    :param port_base: port of the first party
+    :param my_client_id: client id, also used for the certificate
+    :param timeout: time in seconds to keep retrying connections
+    :param max_retry_delay: maximum time in seconds between retries
+
+    Use as follows::
+
+        async with AsyncClient(hostnames, 14000, 0) as client:
+            await client.send_private_inputs([x])
+            res = await client.receive_outputs(1)
+
+    """
+    retry_delay = 0.1
+
+    def __init__(self, hostnames, port_base, my_client_id, timeout=60,
+                 max_retry_delay=1):
+        self.hostnames = hostnames
+        self.port_base = port_base
+        self.my_client_id = my_client_id
+        self.timeout = timeout
+        self.max_retry_delay = max_retry_delay
+        self.connections = []
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def connect(self):
+        """ Connect to all parties and receive the domain
+        specification. """
+        ctx = client_context(self.my_client_id)
+        self.connections = await asyncio.gather(
+            *(self.open(i, hostname, ctx)
+              for i, hostname in enumerate(self.hostnames)))
+        self.specification = await self.receive(0)
+        self.domain, self.clear_domain = read_domains(self.specification)
+
+    async def open(self, i, hostname, ctx):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        delay = self.retry_delay
+        while True:
+            try:
+                sock = await connect_socket(hostname, self.port_base + i)
+                break
+            except ConnectionRefusedError:
+                if loop.time() + delay > deadline:
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, self.max_retry_delay)
+        set_keepalive(sock)
+        client_id = b'%d' % self.my_client_id
+        await loop.sock_sendall(
+            sock, struct.pack('<i', len(client_id)) + client_id)
+        return await asyncio.open_connection(
+            sock=sock, ssl=ctx, server_hostname='P%d' % i)
+
+    async def close(self):
+        for reader, writer in self.connections:
+            writer.close()
+        await asyncio.gather(*(writer.wait_closed()
+                               for reader, writer in self.connections),
+                             return_exceptions=True)
+        self.connections = []
+
+    async def receive(self, i):
+        """ Receive an octetStream from party :py:obj:`i`. """
+        reader = self.connections[i][0]
+        length = struct.unpack('<I', await reader.readexactly(4))[0]
+        os = octetStream()
+        os.buf = await reader.readexactly(length)
+        return os
+
+    async def send(self, os):
+        """ Send an octetStream to all parties. """
+        for reader, writer in self.connections:
+            writer.write(struct.pack('<i', len(os.buf)))
+            writer.write(os.buf)
+        await asyncio.gather(*(writer.drain()
+                               for reader, writer in self.connections))
+
+    async def receive_triple_values(self, T, n):
+        streams = await asyncio.gather(
+            *(self.receive(i) for i in range(len(self.connections))))
+        return reconstruct_triples(T, n, streams)
+
+    async def send_private_inputs(self, values):
+        T = self.domain
+        masks = (await self.receive_triple_values(T, len(values)))[0]
+        await self.send(mask_inputs(T, values, masks))
+
+    async def receive_outputs(self, n):
+        T = self.domain
+        values = (await self.receive_triple_values(T, n))[0]
+        return self.clear_domain.int_many(values)
+
+    def input_session(self, batch_size, n_values=None, window=2, padding=0):
+        """ Pipelined input session, see :py:class:`InputSession`. """
+        return InputSession(self, batch_size, n_values, window, padding)
+
+class InputSession:
+    """ Streaming input to a server that receives the values in
+    batches of :py:obj:`batch_size`, for example by calling
+    ``sint.receive_from_client(batch_size, ...)`` in a loop. Triples
+    are received and checked in the background while values are
+    masked and sent, so the client must not be used otherwise while
+    the session is open.
+
+    :param client: connected :py:class:`AsyncClient`
+    :param batch_size: number of values per round
+    :param n_values: total number of values if known, which allows
+      receiving triples before the corresponding values are given
+    :param window: maximum number of batches of triples held ahead
+    :param padding: value used to fill the last batch
+
+    Use as follows::
+
+        async with client.input_session(1000) as session:
+            await session.send_many(values)
+
+    """
+    def __init__(self, client, batch_size, n_values=None, window=2,
+                 padding=0):
+        assert window > 0
+        self.client = client
+        self.batch_size = batch_size
+        if n_values is None:
+            self.n_batches = None
+        else:
+            self.n_batches = -(-n_values // batch_size)
+        self.padding = padding
+        self.masks = asyncio.Queue(window)
+        self.batch = []
+        self.n_started = 0
+        self.started = asyncio.Event()
+        self.reader = None
+
+    async def __aenter__(self):
+        self.reader = asyncio.ensure_future(self.prefetch())
+        return self
+
+    async def __aexit__(self, exc_type, *args):
+        try:
+            if exc_type is None:
+                await self.flush()
+        finally:
+            self.reader.cancel()
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+    async def prefetch(self):
+        T = self.client.domain
+        i = 0
+        try:
+            while self.n_batches is None or i < self.n_batches:
+                # without a total, only receive triples for batches in use
+                while self.n_batches is None and i >= self.n_started:
+                    self.started.clear()
+                    await self.started.wait()
+                masks = await self.client.receive_triple_values(
+                    T, self.batch_size)
+                await self.masks.put(masks[0])
+                i += 1
+        except Exception as e:
+            await self.masks.put(e)
+
+    async def send(self, value):
+        """ Send a single value. """
+        await self.send_many([value])
+
+    async def send_many(self, values):
+        """ Send values from an iterable or asynchronous iterable. """
+        if hasattr(values, '__aiter__'):
+            async for value in values:
+                await self.add([value])
+        else:
+            values = iter(values)
+            while True:
+                chunk = list(itertools.islice(
+                    values, self.batch_size - len(self.batch)))
+                if not chunk:
+                    break
+                await self.add(chunk)
+
+    async def add(self, values):
+        if not self.batch:
+            self.n_started += 1
+            self.started.set()
+        self.batch += values
+        if len(self.batch) == self.batch_size:
+            await self.send_batch()
+
+    async def send_batch(self):
+        masks = await self.masks.get()
+        if isinstance(masks, Exception):
+            raise masks
+        batch, self.batch = self.batch, []
+        await self.client.send(mask_inputs(self.client.domain, batch, masks))
+
+    async def flush(self):
+        """ Send the current batch, padded if incomplete. """
+        if self.batch:
+            self.batch += [self.padding] * (self.batch_size - len(self.batch))
+            await self.send_batch()
 
 class octetStream:
     def __init__(self, value=None):
@@ -132,10 +536,11 @@ class octetStream:
         socket.sendall(self.buf)
 
     def Receive(self, socket):
-        length = struct.unpack('<I', socket.recv(4))[0]
-        self.buf = b''
-        while len(self.buf) < length:
-            self.buf += socket.recv(length - len(self.buf))
+        header = bytearray(4)
+        recv_exactly(socket, header)
+        length = struct.unpack('<I', header)[0]
+        self.buf = bytearray(length)
+        recv_exactly(socket, self.buf)
         self.ptr = 0
 
     def store(self, value):
@@ -165,6 +570,48 @@ class octetStream:
             return 0
 
     def consume(self, length):
+        """ The next :py:obj:`length` bytes. """
+        return bytes(self._consume_view(length))
+
+    def _consume_view(self, length):
+        """ Zero-copy view of the next :py:obj:`length` bytes for
+        parsing. The view must be released before the stream is
+        changed because resizing the buffer fails while a view
+        exists. """
         self.ptr += length
         assert self.ptr <= len(self.buf)
-        return self.buf[self.ptr - length:self.ptr]
+        return memoryview(self.buf)[self.ptr - length:self.ptr]
+
+def batches(values, batch_size):
+    values = iter(values)
+    while True:
+        batch = list(itertools.islice(values, batch_size))
+        if not batch:
+            return
+        yield batch
+
+async def connect_socket(hostname, port):
+    """ Non-blocking equivalent of :py:func:`socket.create_connection`. """
+    loop = asyncio.get_running_loop()
+    error = None
+    for family, type, proto, _, address in await loop.getaddrinfo(
+            hostname, port, type=socket.SOCK_STREAM):
+        sock = socket.socket(family, type, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error
+
+def recv_exactly(socket, buf):
+    """ Fill a preallocated buffer from a socket without intermediate
+    copies. """
+    view = memoryview(buf)
+    while view:
+        n = socket.recv_into(view)
+        if not n:
+            raise ConnectionError('connection closed')
+        view = view[n:]
@@ -1,5 +1,52 @@
+import itertools
+import operator
 import struct
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# struct formats for word sizes without numpy
+formats = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+def word_array(buf, n_bytes):
+    """ NumPy array of 64-bit words from little-endian unsigned
+    integers of at most eight bytes each. """
+    if n_bytes == 8:
+        return numpy.frombuffer(buf, '<u8')
+    n = len(buf) // n_bytes
+    words = numpy.zeros((n, 8), numpy.uint8)
+    words[:, :n_bytes] = numpy.frombuffer(buf, numpy.uint8).reshape(
+        n, n_bytes)
+    return words.view('<u8').ravel()
+
+def words_from_bytes(buf, n_bytes):
+    """ Little-endian unsigned integers of :py:obj:`n_bytes` bytes
+    each from a contiguous buffer. """
+    n = len(buf) // n_bytes
+    if n_bytes <= 8 and numpy is not None:
+        return word_array(buf, n_bytes).tolist()
+    if n_bytes in formats:
+        return list(struct.unpack('<%d%s' % (n, formats[n_bytes]), buf))
+    buf = memoryview(buf)
+    from_bytes = int.from_bytes
+    return [from_bytes(buf[i:i + n_bytes], 'little')
+            for i in range(0, n * n_bytes, n_bytes)]
+
+def words_to_bytes(values, n_bytes):
+    """ Contiguous little-endian representation of unsigned integers
+    of :py:obj:`n_bytes` bytes each. """
+    if n_bytes <= 8 and numpy is not None:
+        words = numpy.array(values, dtype='<u8')
+        if n_bytes == 8:
+            return words.tobytes()
+        return words.view(numpy.uint8).reshape(-1, 8)[:, :n_bytes].tobytes()
+    if n_bytes in formats:
+        return struct.pack('<%d%s' % (len(values), formats[n_bytes]),
+                           *values)
+    return b''.join([v.to_bytes(n_bytes, 'little') for v in values])
+
 class Domain:
     def __init__(self, value=0):
         self.v = int(round(value)) % self.modulus
@@ -50,8 +97,91 @@ class Domain:
         #Instead of using python a loop per value we let struct pack handle all it
         os.buf += struct.pack('<{}B'.format(len(temp_buf)), *tuple(temp_buf))
 
+    @classmethod
+    def unpack_many(cls, os, n):
+        """ Read :py:obj:`n` values as list of integers in
+        :math:`[0, modulus)`. """
+        return words_from_bytes(os._consume_view(n * cls.n_bytes), cls.n_bytes)
+
+    @classmethod
+    def pack_many(cls, values, os):
+        """ Write a sequence of integers, reducing them modulo the
+        domain. """
+        modulus = cls.modulus
+        os.buf += words_to_bytes([v % modulus for v in values], cls.n_bytes)
+
+    @classmethod
+    def int_many(cls, values):
+        """ Signed representatives of a sequence of integers as with
+        :py:func:`int`. """
+        modulus = cls.modulus
+        half = (modulus + 1) // 2
+        res = [v % modulus for v in values]
+        return [v if v < half else v - modulus for v in res]
+
+    # Operations on vectors of values as used by the client. Vectors
+    # are lists of integers here.
+
+    @classmethod
+    def unpack_vectors(cls, os, n, k):
+        """ Read :py:obj:`n` groups of :py:obj:`k` values and return
+        the :py:obj:`k` component vectors. """
+        values = cls.unpack_many(os, n * k)
+        return [values[i::k] for i in range(k)]
+
+    @classmethod
+    def add_vectors(cls, a, b):
+        """ Element-wise sum without reduction. """
+        return list(map(operator.add, a, b))
+
+    @classmethod
+    def reduce_vector(cls, a):
+        return list(map(operator.mod, a, itertools.repeat(cls.modulus)))
+
+    @classmethod
+    def valid_triples(cls, a, b, c):
+        """ Whether :math:`a_i b_i = c_i` for all reduced entries. """
+        products = map(operator.mod, map(operator.mul, a, b),
+                       itertools.repeat(cls.modulus))
+        return not any(map(operator.ne, products, c))
+
+    @classmethod
+    def to_list(cls, a):
+        return a
+
+class WordDomain(Domain):
+    """ Domain of at most 64 bits with vectors as NumPy arrays,
+    where arithmetic modulo :math:`2^{64}` is native. """
+
+    @classmethod
+    def unpack_vectors(cls, os, n, k):
+        words = word_array(os._consume_view(n * k * cls.n_bytes), cls.n_bytes)
+        # copy to release the view of the stream
+        return list(words.reshape(n, k).T.copy())
+
+    @classmethod
+    def add_vectors(cls, a, b):
+        return a + b
+
+    @classmethod
+    def reduce_vector(cls, a):
+        return a & numpy.uint64(cls.modulus - 1)
+
+    @classmethod
+    def valid_triples(cls, a, b, c):
+        return not ((a * b - c) & numpy.uint64(cls.modulus - 1)).any()
+
+    @classmethod
+    def to_list(cls, a):
+        return a.tolist()
+
 def Z2(k):
-    class Z(Domain):
+    if numpy is not None and k <= 64:
+        base = WordDomain
+    else:
+        base = Domain
+
+    class Z(base):
         modulus = 2 ** k
         n_words = (k + 63) // 64
         n_bytes = (k + 7) // 8
@@ -66,7 +196,7 @@ def Fp(mod):
         n_words = (modulus.bit_length() + 63) // 64
         n_bytes = 8 * n_words
         R = 2 ** (64 * n_words) % modulus
-        R_inv = gmpy2.invert(R, modulus)
+        R_inv = int(gmpy2.invert(R, modulus))
 
         def unpack(self, os):
             Domain.unpack(self, os)
@@ -75,4 +205,29 @@ def Fp(mod):
         def pack(self, os):
             Domain.pack(type(self)(self.v * self.R), os)
 
+        @classmethod
+        def unpack_many(cls, os, n):
+            R_inv, modulus = cls.R_inv, cls.modulus
+            return [v * R_inv % modulus for v in super().unpack_many(os, n)]
+
+        @classmethod
+        def pack_many(cls, values, os):
+            R, modulus = cls.R, cls.modulus
+            os.buf += words_to_bytes([v * R % modulus for v in values],
+                                     cls.n_bytes)
+
+        # Shares are summed in Montgomery form and converted once.
+
+        @classmethod
+        def unpack_vectors(cls, os, n, k):
+            values = words_from_bytes(os._consume_view(n * k * cls.n_bytes),
+                                      cls.n_bytes)
+            return [values[i::k] for i in range(k)]
+
+        @classmethod
+        def reduce_vector(cls, a):
+            return list(map(operator.mod,
+                            map(operator.mul, a, itertools.repeat(cls.R_inv)),
+                            itertools.repeat(cls.modulus)))
+
     return Fp
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import json
+
+sys.path.append('.')
+
+from Compiler import bytecode_stats
+
+parser = argparse.ArgumentParser(
+    description='Statistics of a compiled program per tape and basic block')
+parser.add_argument('program', help='program with arguments as compiled')
+parser.add_argument('--json', action='store_true',
+                    help='output JSON instead of tables')
+parser.add_argument('-n', '--top', type=int, default=10,
+                    help='number of instructions and blocks to list '
+                    '(default: 10)')
+parser.add_argument('--cache', default='Programs/Stats',
+                    help='cache directory (default: Programs/Stats)')
+parser.add_argument('--no-cache', action='store_true',
+                    help='do not use the cache')
+args = parser.parse_args()
+
+cache = None if args.no_cache else bytecode_stats.StatsCache(args.cache)
+stats = bytecode_stats.program_stats(args.program, cache)
+
+if args.json:
+    json.dump(stats, sys.stdout, indent=1)
+    print()
+    sys.exit()
+
+domain_size = stats['domain_size']
+
+def summary(x, indent=''):
+    print('%s%10d instructions' % (indent, x['instructions']))
+    print('%s%10d rounds' % (indent, x['rounds']))
+    print('%s%10d opened elements' % (indent, x['opens']))
+    print('%s%10d estimated bytes sent per party' %
+          (indent, x['communication'] * domain_size))
+    for line in bytecode_stats.requirements_from_json(x['prep']).pretty():
+        print('%s%s' % (indent, line[2:]))
+
+for tape in stats['tapes']:
+    print('Tape %s (%d blocks):' % (tape['name'], len(tape['blocks'])))
+    summary(tape)
+    print('Declared preprocessing:')
+    for line in bytecode_stats.requirements_from_json(tape['usage']).pretty():
+        print(line)
+    print('Memory:')
+    for t, n in tape['memory'].items():
+        print('%10d %s' % (n, t))
+    print('Registers:')
+    for t, n in tape['registers'].items():
+        print('%10d %s' % (n, t))
+    print('Most frequent instructions:')
+    for name, n in list(tape['histogram'].items())[:args.top]:
+        print('%10d %s' % (n, name))
+    blocks = sorted(tape['blocks'], reverse=True,
+                    key=lambda block: (block['rounds'], block['instructions']))
+    print('Blocks with the most rounds:')
+    for block in blocks[:args.top]:
+        end = block['start'] + block['instructions']
+        jump = '' if block['jump'] is None else ', jump to %d' % block['jump']
+        print('  instructions %d-%d%s:' % (block['start'], end - 1, jump))
+        summary(block, '  ')
+    print()
+
+print('The program requires at least an estimated %f-%f GB of RAM per party.'
+      % (stats['min_ram'] * 1e-9, stats['max_ram'] * 1e-9))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+
+sys.path.append('.')
+
+from Compiler.interpreter import Interpreter, InterpreterError
+
+parser = argparse.ArgumentParser(
+    description='Run a compiled program in the clear for testing')
+parser.add_argument('program', help='program with arguments as compiled')
+parser.add_argument('-N', '--n-players', type=int, default=2,
+                    help='number of parties (default: 2)')
+parser.add_argument('-IF', '--input-prefix', default='Player-Data/Input',
+                    help='prefix of input files '
+                    '(default: Player-Data/Input)')
+parser.add_argument('-P', '--prime', type=int, default=None,
+                    help='prime modulus (default: as in the virtual machine)')
+parser.add_argument('-lgp', '--lgp', type=int, default=128,
+                    help='minimal bit length of the prime (default: 128)')
+parser.add_argument('-s', '--seed', type=int, default=None,
+                    help='seed for local randomness')
+args = parser.parse_args()
+
+interpreter = Interpreter(args.program, n_players=args.n_players,
+                          input_prefix=args.input_prefix, prime=args.prime,
+                          lgp=args.lgp, seed=args.seed)
+try:
+    print(interpreter.run(), end='')
+except InterpreterError as e:
+    print(interpreter.out.decode(errors='replace'), end='')
+    print('Error:', e, file=sys.stderr)
+    sys.exit(1)
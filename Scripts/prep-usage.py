@@ -1,23 +1,17 @@
 #!/usr/bin/env python3
 
-import sys, os
-import collections
+import sys
 
 sys.path.append('.')
 
-from Compiler.program import *
-from Compiler.instructions_base import *
+from Compiler.program import Program
+from Compiler import bytecode_stats
 
 if len(sys.argv) <= 1:
     print('Usage: %s <program>' % sys.argv[0])
 
-res = collections.defaultdict(lambda: 0)
-m = 0
-
 tapename = next(Program.read_tapes(sys.argv[1]))
-res = Tape.ReqNum()
-for inst in Tape.read_instructions(tapename):
-    res.update(inst.get_usage())
+res = bytecode_stats.tape_stats('Programs/Bytecode/%s.bc' % tapename)
 
-for x in res.pretty():
+for x in bytecode_stats.requirements_from_json(res['usage']).pretty():
     print(x)
@@ -0,0 +1,4 @@
+#!/bin/bash
+
+./compile.py -b 100000 --autotune rounds=100 test_autotune || exit 1
+Scripts/interpret.py test_autotune || exit 1
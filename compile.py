@@ -18,9 +18,9 @@ from Compiler.compilerLib import Compiler
 def compilation(compiler):
     prog = compiler.compile_file()
 
-    if prog.public_input_file is not None:
+    if prog.public_input_filename is not None:
         print(
-            "WARNING: %s is required to run the program" % prog.public_input_file.name
+            "WARNING: %s is required to run the program" % prog.public_input_filename
         )
 
 
@@ -8,26 +8,87 @@ repo_root = Path(__file__).parent.parent
 import sys
 sys.path.append(str(repo_root))
 
-from Compiler.library import print_ln, for_range
-from Compiler.types import sint, sfix, Matrix, sfloat, Array
+from Compiler.library import print_ln, for_range, for_range_opt, runtime_error_if
+from Compiler.types import sint, sintbit, sfix, Matrix, sfloat, Array, cint, regint
 from Compiler.util import if_else
 from Compiler.mpc_math import sqrt, exp2_fx, log2_fx
+from Compiler.sorting import radix_sort_from_matrix, reveal_sort
 
 
 MAGIC_NUMBER = 999
 
-def read_data(party_index: int, num_columns: int, num_rows: int) -> Matrix:
+# Missing values are MAGIC_NUMBER in the data. Finding them takes a secure
+# comparison per element, so the functions below optionally take a validity
+# mask (sintbit, 1 for present and 0 for missing values) that is computed
+# once with valid_mask() or read_data_with_mask() and carried along with
+# the data by join_with_mask() and where_with_mask(). Without a mask, it is
+# computed from the data on every call.
+
+def read_data(party_index: int, num_columns: int, num_rows, max_rows: int = None) -> Matrix:
     """
     Read data from each party's input file to a Matrix in MP-SPDZ circuit.
+
+    The input file contains the columns one after another. The whole Matrix
+    is read with vectorized input instructions, so the compile time and the
+    bytecode size don't depend on the number of cells.
+
+    :param party_index: The party to read the data from
+    :param num_columns: The number of columns (compile-time)
+    :param num_rows: The number of rows, either compile-time (int) or only
+      known at run time (regint/cint)
+    :param max_rows: The number of rows to allocate if num_rows is only known
+      at run time. The rows beyond num_rows are set to MAGIC_NUMBER, and the
+      computation aborts if num_rows exceeds max_rows.
     """
-    data = Matrix(num_columns, num_rows, sfix)
-    # TODO: use @for_range_opt instead?
-    for i in range(num_columns):
-        for j in range(num_rows):
+    if isinstance(num_rows, int):
+        data = Matrix(num_columns, num_rows, sfix)
+        # nothing to read, and input_from() doesn't support empty matrices
+        if num_rows > 0:
+            data.input_from(party_index)
+        return data
+
+    if max_rows is None:
+        raise ValueError('max_rows is required if num_rows is not known at compile time')
+    num_rows = regint(num_rows)
+    runtime_error_if(num_rows > max_rows,
+                     'read_data: %s rows exceed max_rows=%s', num_rows, max_rows)
+    data = Matrix(num_columns, max_rows, sfix)
+    data.assign_all(MAGIC_NUMBER)
+
+    @for_range(num_columns)
+    def _(i):
+        @for_range_opt(num_rows)
+        def _(j):
             data[i][j] = sfix.get_input_from(party_index)
+
     return data
 
 
+def valid_mask(data):
+    """
+    Compute the validity mask of a column or Matrix with one vectorized
+    comparison.
+
+    :param data: sfix.Array, Matrix row, list of sfix or Matrix
+    :return: sintbit.Array or sintbit Matrix of the same shape
+    """
+    if isinstance(data, Matrix):
+        mask = Matrix(*data.shape, sintbit)
+        mask.assign_vector(data.get_vector() != MAGIC_NUMBER)
+        return mask
+    return Array.create_from(_to_vector(data) != MAGIC_NUMBER)
+
+
+def read_data_with_mask(party_index: int, num_columns: int, num_rows, max_rows: int = None) -> (Matrix, Matrix):
+    """
+    Read data like read_data() and compute its validity mask.
+
+    :return: The data and the sintbit Matrix of the same shape
+    """
+    data = read_data(party_index, num_columns, num_rows, max_rows)
+    return data, valid_mask(data)
+
+
 def print_data(data: Matrix):
     """
     Print the data in the Matrix.
@@ -39,22 +100,50 @@ def print_data(data: Matrix):
             print_ln("data[{}][{}]: %s".format(i, j), data[i][j].reveal())
 
 
-def _mean(data: list[sfix]) -> (sfix, sfix):
-    total = sfix(sum(if_else(i != MAGIC_NUMBER, i, 0) for i in data))
-    count = sfix(sum(if_else(i != MAGIC_NUMBER, 1, 0) for i in data))
+def _to_vector(data):
+    """
+    Return the column as a single vector so that the aggregates below
+    emit one vectorized instruction per operation instead of one per element.
+
+    :param data: Array, Matrix row, vector or list of sfix or sint
+    """
+    if isinstance(data, Array):
+        return data.get_vector()
+    if isinstance(data, (sfix, sint)):
+        return data
+    return Array.create_from(data).get_vector()
+
+
+def _valid_vector(data: sfix, mask) -> sint:
+    """
+    Return the validity mask of the data vector as a vector, using the
+    given mask if any.
+    """
+    if mask is None:
+        return data != MAGIC_NUMBER
+    mask = _to_vector(mask)
+    assert len(mask) == len(data)
+    return mask
+
+
+def _mean(data: list[sfix], mask=None) -> (sfix, sfix):
+    data = _to_vector(data)
+    is_valid = _valid_vector(data, mask)
+    total = sfix(if_else(is_valid, data, 0).sum())
+    count = sfix(is_valid.sum())
     return total / count, count
 
 
-def _variance(data: list[sfix], use_bessels: bool) -> sfix:
-    # calculate mean of the data excluding magic numbers
-    mean, eff_size = _mean(data)
+def _variance(data: list[sfix], use_bessels: bool, mask=None) -> sfix:
+    data = _to_vector(data)
+    is_valid = _valid_vector(data, mask)
 
-    # replace magic number w/ mean to skip magic number in for loop below
-    data = Array.create_from(if_else(n != MAGIC_NUMBER, n, mean) for n in data)
+    # calculate mean of the data excluding magic numbers
+    mean, eff_size = _mean(data, is_valid)
 
-    eff_data_sum = sfix(0)
-    for n in data:
-        eff_data_sum.update(eff_data_sum + (n - mean) ** 2)
+    # replace magic number w/ mean so that it doesn't contribute to the sum
+    data = if_else(is_valid, data, mean)
+    eff_data_sum = sfix(((data - mean) ** 2).sum())
 
     if use_bessels:
         eff_size -= 1
@@ -64,29 +153,90 @@ def _variance(data: list[sfix], use_bessels: bool) -> sfix:
 
 # Top 5 functions to implement
 
-def mean(data: list[sfix]) -> sfix:
-    return _mean(data)[0]
+def mean(data: list[sfix], mask=None) -> sfix:
+    return _mean(data, mask)[0]
 
 
-def median(data: list[sfix]):
-    # TODO: Check if Array.create_from is properly constrained // if I dont put reference, it's just from the mp-spdz doc itself
-    data = Array.create_from(data)
-    # TODO: Check if there's a need to use sfix(0), can we just use 0? would that violate constraint?
-    median_odd = sfix(0)
-    median_even = sfix(0)
-    data.sort()
-    size = sum(if_else(i!= MAGIC_NUMBER, 1, 0) for i in data)
-
-    # TODO: Check if for_range is any different than naive Python for-loop
-    @for_range(len(data))
-    def _(i):
-        # TODO: Check if wrapping sfix() makes sense/ properly constrained
-        # TODO: Check why we cannot just use size.int_div(2) -> it returns wrong result, so now we use the method below instead.
-        median_odd.update(median_odd+(size==2*sfix(i)+size%2)*data[i])
-        # TODO: Check if there's the need to use update: See example in Compiler.library.for_range(start, stop=None, step=None) in the mp-spdz doc itself
-        median_even.update(median_even+(size==2*sfix(i)+size%2)*data[i]/2+(size-2==2*sfix(i)+size%2)*data[i]/2)
-    # TODO: Check if size%2 is properly constrained
-    return (size%2)*median_odd + (1-size%2)*median_even
+def median(data: list[sfix], mask=None):
+    return quantiles(data, [0.5], mask)[0]
+
+
+def quantiles(data: list[sfix], qs: list[float], mask=None) -> Array:
+    """
+    Compute several quantiles of the data excluding magic numbers with a
+    single sort.
+
+    The q-quantile is interpolated linearly between the closest ranks, i.e.,
+    it is x[i] + (p - i) * (x[i + 1] - x[i]) for p = q * (size - 1) and
+    i = floor(p), where x is the sorted data. This is the same as
+    statistics.quantiles(data, method='inclusive') and statistics.median.
+
+    The number of valid values stays secret, so x[i] and x[i + 1] are read
+    at secret indices. If all values are missing, every quantile is
+    MAGIC_NUMBER.
+
+    :param data: The data
+    :param qs: Fractions between 0 and 1 (compile-time)
+    :param mask: The validity mask of the data (optional)
+    :return: sfix.Array with one quantile per fraction
+    """
+    data = _to_vector(data)
+    n = len(data)
+    num_qs = len(qs)
+    is_missing = 1 - _valid_vector(data, mask)
+    size = n - is_missing.sum()
+    is_empty = size.equal(0, n.bit_length() + 1)
+
+    # sort with magic numbers at the end by using the missing flag as the
+    # most significant bit of the key
+    sorted_data = sfix.Array(n)
+    sorted_data.assign_vector(data)
+    key_bits = data.v.bit_decompose(sfix.k)
+    key_bits[-1] = key_bits[-1].bit_not()
+    radix_sort_from_matrix(Matrix.create_from(key_bits + [is_missing]), sorted_data)
+
+    # position p in fixed-point representation, computed without truncation
+    # for all quantiles at once, with size - 1 replaced by 0 if there are no
+    # valid values to keep the index in range
+    size_minus_1 = (size - 1 + is_empty).expand_to_vector(num_qs)
+    pos = size_minus_1 * cint([int(round(q * 2 ** sfix.f)) for q in qs])
+    index_bit_length = n.bit_length() + 1
+    index = pos.right_shift(sfix.f, sfix.f + index_bit_length)
+    fraction = sfix._new(pos - (index << sfix.f))
+
+    # secret-index reads of x[i] and x[i + 1] for all quantiles in one batch
+    all_index = sint.concat([index[j].expand_to_vector(n) for j in range(num_qs)])
+    one_hot = all_index.equal(regint.inc(n * num_qs, wrap=n), index_bit_length)
+    lower = sorted_data.get_vector()
+    upper = sfix.concat([
+        sorted_data.get_vector(1, n - 1),
+        sorted_data.get_vector(n - 1, 1),
+    ])
+    res = sfix.Array(num_qs)
+    for j in range(num_qs):
+        selector = one_hot.get_vector(j * n, n)
+        x_lower = lower.dot(selector)
+        x_upper = upper.dot(selector)
+        res[j] = x_lower + fraction[j] * (x_upper - x_lower)
+    res.assign_vector(if_else(is_empty.expand_to_vector(num_qs),
+                              sfix(MAGIC_NUMBER, size=num_qs), res.get_vector()))
+    return res
+
+
+def percentiles(data: list[sfix], ps: list[float], mask=None) -> Array:
+    """
+    Compute several percentiles (0 to 100) of the data with a single sort.
+    See :py:func:`quantiles`.
+    """
+    return quantiles(data, [p / 100 for p in ps], mask)
+
+
+def five_number_summary(data: list[sfix], mask=None) -> Array:
+    """
+    Minimum, lower quartile, median, upper quartile and maximum of the data
+    with a single sort.
+    """
+    return quantiles(data, [0, 0.25, 0.5, 0.75, 1], mask)
 
 
 def join(data1: Matrix, data2: Matrix, data1_column_index: int, data2_column_index: int) -> Matrix:
@@ -110,6 +260,46 @@ def join(data1: Matrix, data2: Matrix, data1_column_index: int, data2_column_ind
         [0, MAGIC_NUMBER, MAGIC_NUMBER, 3],
         [60, MAGIC_NUMBER, MAGIC_NUMBER, 50],
     ]
+
+    The rows of both matrices are concatenated and sorted by key with
+    radix sort, where the rows of data2 come before the rows of data1 with
+    the same key. Each data1 row then picks up the values of the closest
+    preceding data2 row with a prefix propagation in logarithmically many
+    rounds, and the result is brought back into the original order of data1
+    by undoing the sort permutation. This takes O(n log n) secure operations
+    for n = n1 + n2 rows. If several rows of data2 match, the last one is
+    used.
+    """
+    return _join(data1, data2, data1_column_index, data2_column_index)[0]
+
+
+def join_with_mask(data1: Matrix, data2: Matrix, data1_column_index: int, data2_column_index: int, mask1: Matrix = None, mask2: Matrix = None) -> (Matrix, Matrix):
+    """
+    Like join(), but also return the validity mask of the result. The mask
+    of the data2 part is carried through the join without comparisons.
+
+    :param mask1: The validity mask of data1 (optional)
+    :param mask2: The validity mask of data2 (optional)
+    :return: The joined matrix and its sintbit validity mask
+    """
+    if mask1 is None:
+        mask1 = valid_mask(data1)
+    if mask2 is None:
+        mask2 = valid_mask(data2)
+    new_data, new_mask2 = _join(data1, data2, data1_column_index, data2_column_index, mask2)
+    num_columns_1 = data1.shape[0]
+    new_mask = Matrix(*new_data.shape, sintbit)
+    for i in range(num_columns_1):
+        new_mask[i].assign_vector(mask1[i].get_vector())
+    for k, mask in enumerate(new_mask2):
+        new_mask[num_columns_1 + k].assign_vector(mask)
+    return new_data, new_mask
+
+
+def _join(data1: Matrix, data2: Matrix, data1_column_index: int, data2_column_index: int, mask2: Matrix = None) -> (Matrix, list):
+    """
+    See join(). If mask2 is given, it is joined along with data2, and the
+    validity masks of the data2 part of the result are returned as well.
     """
     # E.g. [2, 4]
     num_columns_1 = data1.shape[0]
@@ -119,94 +309,229 @@ def join(data1: Matrix, data2: Matrix, data1_column_index: int, data2_column_ind
     num_columns_2 = data2.shape[0]
     num_rows_2 = data2.shape[1]
 
+    n = num_rows_2 + num_rows_1
+
+    num_masks = 0 if mask2 is None else num_columns_2
+
+    # Rows of data2 followed by rows of data1, one row per element.
+    # Columns: key, whether the row is from data2, values of data2, mask2
+    key = sint.concat([
+        data2[data2_column_index].get_vector().v,
+        data1[data1_column_index].get_vector().v,
+    ])
+    is_data2 = sint.concat([sint(1, size=num_rows_2), sint(0, size=num_rows_1)])
+    rows = sint.Matrix(n, 2 + num_columns_2 + num_masks)
+    rows.set_column(0, key)
+    rows.set_column(1, is_data2)
+    for k in range(num_columns_2):
+        rows.set_column(2 + k, sint.concat([
+            data2[k].get_vector().v,
+            sint(0, size=num_rows_1),
+        ]))
+    for k in range(num_masks):
+        rows.set_column(2 + num_columns_2 + k, sint.concat([
+            mask2[k].get_vector(),
+            sint(0, size=num_rows_1),
+        ]))
+
+    # Sort by key, and by origin within the same key. The sort is stable,
+    # so the data2 rows of a key keep their original order
+    key_bits = key.bit_decompose(sfix.k)
+    key_bits[-1] = key_bits[-1].bit_not()
+    bits = Matrix.create_from([1 - is_data2] + key_bits)
+    perm = radix_sort_from_matrix(bits, rows)
+
+    # Propagate key, values and masks of the last data2 row to the following
+    # rows
+    sorted_key = rows.get_column(0)
+    has_data2 = rows.get_column(1)
+    values = [sorted_key] + [
+        rows.get_column(2 + k) for k in range(num_columns_2 + num_masks)]
+    step = 1
+    while step < n:
+        prev_has = has_data2.get_vector(0, n - step)
+        cur_has = has_data2.get_vector(step, n - step)
+        values = [
+            sint.concat([
+                v.get_vector(0, step),
+                cur_has.if_else(v.get_vector(step, n - step), v.get_vector(0, n - step)),
+            ])
+            for v in values
+        ]
+        has_data2 = sint.concat([
+            has_data2.get_vector(0, step),
+            cur_has + prev_has - cur_has * prev_has,
+        ])
+        step *= 2
+
+    match = has_data2 * (sfix._new(values[0]) == sfix._new(sorted_key))
+    joined = sint.Matrix(n, num_columns_2 + num_masks)
+    for k in range(num_columns_2):
+        joined.set_column(k, match.if_else(sfix._new(values[1 + k]), MAGIC_NUMBER).v)
+    for k in range(num_masks):
+        joined.set_column(num_columns_2 + k, match * values[1 + num_columns_2 + k])
+
+    # Undo the sort so that the data1 rows are at the end in original order
+    reveal_sort(perm, joined, reverse=False)
+
     new_data = Matrix(num_columns_1 + num_columns_2, num_rows_1, sfix)
-    # Initialize the first part of the matrix with data1
     for i in range(num_columns_1):
-        for j in range(num_rows_1):
-            new_data[i][j] = data1[i][j]
-    # Initialize the rest of the matrix with MAGIC_NUMBER
-    for i in range(num_columns_2):
-        for j in range(num_rows_1):
-            new_data[num_columns_1 + i][j] = MAGIC_NUMBER
-
-    # Check the matching index in data1 and data2
-    for i in range(num_rows_1):
-        # Find the corresponding index in data2[data2_column] for data1[data1_column][i]
-        id_in_data1 = data1[data1_column_index][i]
-        for j in range(num_rows_2):
-            # Now checking if data2[data2_column][j] is the same as data1[data1_column][i]
-            id_in_data2 = data2[data2_column_index][j]
-            match = id_in_data1 == id_in_data2
-            # If the match is found, set the entire row of data2[data2_column] to the new_data
-            for k in range(num_columns_2):
-                new_data[num_columns_1 + k][i] = if_else(
-                    match,
-                    data2[k][j],
-                    new_data[num_columns_1 + k][i]
-                )
-    return new_data
-
-
-def covariance(data1: list[sfix], data2: list[sfix]):
-    n = len(data1)
-    mean1, count = _mean(data1)
-    mean2, _ = _mean(data2)
-    data1 = Array.create_from(if_else(i!=MAGIC_NUMBER, i, mean1) for i in data1)
-    data2 = Array.create_from(if_else(i!=MAGIC_NUMBER, i, mean2) for i in data2)
-    # TODO: Check if there's a need to use sfloat(0), can we do something like 0.0
-    x = sfix(0)
-    @for_range(n)
-    def _(i):
-        x.update(x+(data1[i]-mean1)*(data2[i]-mean2))
-    return x/(count-1)
-
-
-def correlation(data1: list[sfix], data2: list[sfix]):
-    n = len(data1)
-    mean1, count = _mean(data1)
-    mean2, _ = _mean(data2)
-    data1 = Array.create_from(if_else(i!=MAGIC_NUMBER, i, mean1) for i in data1)
-    data2 = Array.create_from(if_else(i!=MAGIC_NUMBER, i, mean2) for i in data2)
-    numerator = sfix(0)
-    denominator1 = sfix(0)
-    denominator2 = sfix(0)
-    @for_range(n)
-    def _(i):
-        numerator.update(numerator+(data1[i]-mean1)*(data2[i]-mean2))
-        denominator1.update(denominator1+(data1[i]-mean1).square())
-        denominator2.update(denominator2+(data2[i]-mean2).square())
-    # Check if wrapping sfix() is properly constrainted.
-    return numerator/(sqrt(sfix(denominator1))*sqrt(sfix(denominator2)))
+        new_data[i].assign_vector(data1[i].get_vector())
+    for k in range(num_columns_2):
+        new_data[num_columns_1 + k].assign_vector(
+            sfix._new(joined.get_column(k).get_vector(num_rows_2, num_rows_1)))
+    new_mask2 = [
+        sintbit(joined.get_column(num_columns_2 + k).get_vector(num_rows_2, num_rows_1))
+        for k in range(num_masks)
+    ]
+    return new_data, new_mask2
 
 
-def where(_filter: list[sfix], data: list[sfix]):
-    n = len(data)
-    data = Array.create_from(data)
-    _filter = Array.create_from(_filter)
-    res = sfix.Array(n)
-    @for_range(n)
-    def _(i):
-        res[i] = if_else(_filter[i], data[i], MAGIC_NUMBER)
+def covariance(data1: list[sfix], data2: list[sfix], mask1=None, mask2=None):
+    return describe([data1, data2], ['covariance'], [mask1, mask2])['covariance'][0][1]
+
+
+def correlation(data1: list[sfix], data2: list[sfix], mask1=None, mask2=None):
+    return describe([data1, data2], ['correlation'], [mask1, mask2])['correlation'][0][1]
+
+
+DESCRIBE_STATS = (
+    'count', 'mean', 'variance', 'pvariance', 'stdev', 'pstdev',
+    'covariance', 'correlation',
+)
+
+def describe(columns: list[list[sfix]], stats=DESCRIBE_STATS, masks=None) -> dict:
+    """
+    Compute several statistics of several columns of the same length in one
+    pass, excluding magic numbers.
+
+    The sufficient statistics (count, sum, and the sums of products of the
+    deviations from the mean) are computed once for all columns with
+    vectorized operations, and all requested statistics are derived from
+    them. The results are the same as the ones of the individual functions.
+
+    :param columns: The columns
+    :param stats: Names of the statistics to compute, a subset of
+      DESCRIBE_STATS
+    :param masks: The validity masks of the columns (optional, can contain
+      None for columns without mask)
+    :return: dict from statistic name to sfix.Array with one entry per
+      column, or sfix.Matrix with one entry per pair of columns for
+      'covariance' and 'correlation'. The covariance of two columns uses
+      the count of the first one.
+    """
+    unknown = set(stats) - set(DESCRIBE_STATS)
+    if unknown:
+        raise ValueError(f'unknown statistics: {sorted(unknown)}')
+    columns = [_to_vector(c) for c in columns]
+    m = len(columns)
+    n = len(columns[0])
+    for c in columns:
+        if len(c) != n:
+            raise ValueError('columns must have the same length')
+
+    if masks is None:
+        masks = [None] * m
+    data = sfix.concat(columns)
+    is_valid = sint.concat([_valid_vector(c, mask) for c, mask in zip(columns, masks)])
+    masked = if_else(is_valid, data, 0)
+    count = sfix(sint.concat([is_valid.get_vector(j * n, n).sum() for j in range(m)]))
+    total = sfix.concat([masked.get_vector(j * n, n).sum() for j in range(m)])
+    mean = total / count
+
+    res = {}
+    if 'count' in stats:
+        res['count'] = Array.create_from(count)
+    if 'mean' in stats:
+        res['mean'] = Array.create_from(mean)
+
+    # sums of products of deviations from the mean, where magic numbers don't
+    # contribute, for each column and optionally each pair of columns
+    if set(stats) & {'covariance', 'correlation'}:
+        pairs = [(a, b) for a in range(m) for b in range(a, m)]
+    elif set(stats) & {'variance', 'pvariance', 'stdev', 'pstdev'}:
+        pairs = [(a, a) for a in range(m)]
+    else:
+        return res
+    mean_all = sfix._new(sint.concat([mean.v[j].expand_to_vector(n) for j in range(m)]))
+    deviation = if_else(is_valid, data - mean_all, 0)
+    products = (
+        sfix.concat([deviation.get_vector(a * n, n) for a, _ in pairs]) *
+        sfix.concat([deviation.get_vector(b * n, n) for _, b in pairs])
+    )
+    sums = sfix.concat([products.get_vector(i * n, n).sum() for i in range(len(pairs))])
+    sum_of_products = {pair: sums[i] for i, pair in enumerate(pairs)}
+    sum_of_squares = sfix.concat([sum_of_products[a, a] for a in range(m)])
+
+    if set(stats) & {'variance', 'stdev'}:
+        variance = sum_of_squares / (count - 1)
+        if 'variance' in stats:
+            res['variance'] = Array.create_from(variance)
+        if 'stdev' in stats:
+            res['stdev'] = Array.create_from(sqrt(variance))
+    if set(stats) & {'pvariance', 'pstdev'}:
+        pvariance = sum_of_squares / count
+        if 'pvariance' in stats:
+            res['pvariance'] = Array.create_from(pvariance)
+        if 'pstdev' in stats:
+            res['pstdev'] = Array.create_from(sqrt(pvariance))
+
+    def pairwise(denominators):
+        values = sfix.concat([sum_of_products[pair] for pair in pairs]) / denominators
+        matrix = sfix.Matrix(m, m)
+        for i, (a, b) in enumerate(pairs):
+            matrix[a][b] = values[i]
+            matrix[b][a] = values[i]
+        return matrix
+
+    if 'covariance' in stats:
+        res['covariance'] = pairwise(
+            sfix.concat([count[a] - 1 for a, _ in pairs]))
+    if 'correlation' in stats:
+        root = sqrt(sum_of_squares)
+        res['correlation'] = pairwise(
+            sfix.concat([root[a] for a, _ in pairs]) *
+            sfix.concat([root[b] for _, b in pairs]))
     return res
 
 
-def geometric_mean(data: list[sfix]):
-    log_sum = sfix(sum(if_else(i != MAGIC_NUMBER, log2_fx(i), 0) for i in data))
-    num_log_sums = sfix(sum(if_else(i != MAGIC_NUMBER, 1, 0) for i in data))
+def where(_filter: list[sfix], data: list[sfix]):
+    data = _to_vector(data)
+    _filter = _to_vector(_filter)
+    return Array.create_from(if_else(_filter, data, MAGIC_NUMBER))
+
+
+def where_with_mask(_filter: list[sfix], data: list[sfix], mask=None) -> (Array, Array):
+    """
+    Like where(), but also return the validity mask of the result, which
+    is the filter combined with the mask of the data.
+    """
+    data = _to_vector(data)
+    _filter = _to_vector(_filter)
+    is_valid = _filter * _valid_vector(data, mask)
+    res = Array.create_from(if_else(is_valid, data, MAGIC_NUMBER))
+    return res, Array.create_from(sintbit(is_valid))
+
+
+def geometric_mean(data: list[sfix], mask=None):
+    data = _to_vector(data)
+    is_valid = _valid_vector(data, mask)
+    log_sum = sfix(if_else(is_valid, log2_fx(data), 0).sum())
+    num_log_sums = sfix(is_valid.sum())
     exponent = log_sum / num_log_sums
 
     return exp2_fx(exponent)
 
 
-def mode(data: list[sfix]):
+def mode(data: list[sfix], mask=None):
     n = len(data)
     data = Array.create_from(data)
+    is_valid = Array.create_from(_valid_vector(data.get_vector(), mask))
     freqs = sint.Array(n) # sfix doesn't support greater_than
 
     # find frequency of each element in data
-    for i, x in enumerate(data):
-        freqs[i] = if_else(x == MAGIC_NUMBER, 0,
-            sum(if_else(x == data[i], 1, 0) for x in data))
+    for i in range(n):
+        freqs[i] = is_valid[i] * sum(if_else(x == data[i], 1, 0) for x in data)
 
     # find the highest frequency
     highest_freq = sint(0) # sfix doesn't support if_else
@@ -230,26 +555,23 @@ def mode(data: list[sfix]):
     return highest
 
 
-def variance(data: list[sfix]):
-    return _variance(data, True)
+def variance(data: list[sfix], mask=None):
+    return _variance(data, True, mask)
 
 
 # using the formula described in:
 # https://en.wikipedia.org/wiki/Simple_linear_regression
-def linear_regression(xs: list[sfix], ys: list[sfix]):
+def linear_regression(xs: list[sfix], ys: list[sfix], mask1=None, mask2=None):
     # zip(xs, ys) is a list of data points
 
-    xs = Array.create_from(xs)
-    ys = Array.create_from(ys)
+    stats = describe([xs, ys], ['mean', 'variance', 'covariance'], [mask1, mask2])
 
     # calculate slope
-    covar = covariance(xs, ys)
-    var = variance(xs)
-    slope = covar / var
+    slope = stats['covariance'][0][1] / stats['variance'][0]
 
     # calculate intercept
-    x_mean = _mean(xs)[0]
-    y_mean = _mean(ys)[0]
+    x_mean = stats['mean'][0]
+    y_mean = stats['mean'][1]
     intercept = y_mean - slope * x_mean
 
     res = sfix.Array(2)
@@ -257,32 +579,32 @@ def linear_regression(xs: list[sfix], ys: list[sfix]):
     return res
 
 
-def harmonic_mean(data: list[sfix]):
-    eff_size = sfix(sum(if_else(n != MAGIC_NUMBER, 1, 0) for n in data))
-    eff_inv_total = sfix(sum(if_else(n != MAGIC_NUMBER, 1/n, 0) for n in data))
+def harmonic_mean(data: list[sfix], mask=None):
+    data = _to_vector(data)
+    is_valid = _valid_vector(data, mask)
+    eff_size = sfix(is_valid.sum())
+    eff_inv_total = sfix(if_else(is_valid, 1 / data, 0).sum())
     result = eff_size / eff_inv_total
 
     # mpspdz doesn't raise division-by-zero error when data contains zeros
     # whereas statistics.harmonic_mean returns zero if data contain zeros
     # this aligns the behavior with the python counterpart
-    num_zeros = 0
-    for x in data:
-        num_zeros += (x == 0)
+    num_zeros = (data == 0).sum()
     result *= (num_zeros == 0)
 
     return result
 
 
-def pvariance(data: list[sfix]):
-    return _variance(data, False)
+def pvariance(data: list[sfix], mask=None):
+    return _variance(data, False, mask)
 
 
-def pstdev(data: list[sfix]):
-    pvar = _variance(data, False)
+def pstdev(data: list[sfix], mask=None):
+    pvar = _variance(data, False, mask)
     return sqrt(pvar)
 
 
-def stdev(data: list[sfix]):
-    var = _variance(data, True)
+def stdev(data: list[sfix], mask=None):
+    var = _variance(data, True, mask)
     return sqrt(var)
 
@@ -8,8 +8,9 @@ sys.path.append(f'{repo_root}/mpcstats')
 
 from Compiler.library import print_ln
 from Compiler.compilerLib import Compiler
-from Compiler.types import sfix
-from mpcstats_lib import MAGIC_NUMBER, read_data
+from Compiler.interpreter import Interpreter
+from Compiler.types import regint, sfix
+from mpcstats_lib import MAGIC_NUMBER, mean, read_data
 import ast, glob, os, random, re, shutil, statistics, subprocess, sys
 from dataclasses import dataclass
 
@@ -74,7 +75,10 @@ def run_mpcstats_func(
     compiler.register_function(prog)(init_and_compute)
     compiler.compile_func()
 
-    # execute .x
+    # execute .x in the clear unless the virtual machine is requested
+    if os.environ.get('MPCSTATS_BACKEND', 'interpreter') == 'interpreter':
+        return Interpreter(prog, num_parties).run()
+
     cmd = f'PLAYERS={num_parties} {mpc_script} {prog}'
 
     try:
@@ -324,3 +328,28 @@ def execute_join_test(
     print(f'---> {mpspdz_res_val}')
     assert mpspdz_res_val == exp_m
 
+def execute_read_data_test(
+    player_data,
+    selected_col,
+    max_rows,
+):
+    # reads the data with the number of rows only known at run time and
+    # returns the mean of the selected column of party 0
+    data_dir = mpcstats_dir / 'Player-Data'
+    create_player_data_files(data_dir, player_data)
+
+    def computation():
+        m = read_data(0, len(player_data[0]), regint(len(player_data[0][0])), max_rows)
+        res = mean(load_column(m, selected_col)).reveal()
+        print_ln('result: %s', res)
+
+    protocol = 'semi'
+    mpc_script = repo_root / 'Scripts' / f'{protocol}.sh'
+    num_parties = len(player_data)
+    mpspdz_stdout = run_mpcstats_func(
+        computation,
+        num_parties,
+        mpc_script,
+        'testmpc',
+    )
+    return extract_result_from_mpspdz_stdout(mpspdz_stdout)
@@ -7,7 +7,8 @@ sys.path.append(f'{repo_root}/mpcstats')
 import pytest, statistics
 
 import mpcstats_lib
-from .lib import execute_elem_filter_test, execute_join_test, execute_stat_func_test, gen_player_data_for_1_param_func, gen_player_data
+from Compiler.types import sfix
+from .lib import assert_mp_py_diff, execute_elem_filter_test, execute_join_test, execute_read_data_test, execute_stat_func_test, gen_player_data_for_1_param_func, gen_player_data
 
 player_data_4x2_2_party = [
     # party 0
@@ -72,6 +73,59 @@ def test_median_success():
         tolerance = TOLERANCE_SMALL,
     )
 
+def test_quantiles_success():
+    player_data = gen_player_data(30, 2, 2, -100, 100, 0.5)
+    execute_stat_func_test(
+        lambda col: mpcstats_lib.quantiles(col, [0.25, 0.5, 0.75]),
+        lambda col: statistics.quantiles(col, n=4, method='inclusive'),
+        num_params = 1,
+        player_data = player_data,
+        selected_col = 1,
+        tolerance = TOLERANCE_SMALL,
+        vector_res_parser = lambda x: x,
+    )
+
+def test_percentiles_success():
+    def percentiles(col):
+        deciles = statistics.quantiles(col, n=10, method='inclusive')
+        return [min(col), deciles[0], deciles[4], deciles[8], max(col)]
+
+    player_data = gen_player_data(30, 2, 2, -100, 100, 0.5)
+    execute_stat_func_test(
+        lambda col: mpcstats_lib.percentiles(col, [0, 10, 50, 90, 100]),
+        percentiles,
+        num_params = 1,
+        player_data = player_data,
+        selected_col = 1,
+        tolerance = TOLERANCE_SMALL,
+        vector_res_parser = lambda x: x,
+    )
+
+def test_median_all_magic_numbers():
+    execute_stat_func_test(
+        mpcstats_lib.median,
+        lambda col: M,
+        num_params = 1,
+        player_data = pd1([M, M, M, M]),
+        selected_col = 1,
+        tolerance = TOLERANCE_SMALL,
+    )
+
+def test_five_number_summary_success():
+    def five_number_summary(col):
+        return [min(col)] + statistics.quantiles(col, n=4, method='inclusive') + [max(col)]
+
+    player_data = gen_player_data(30, 2, 2, -100, 100, 0.5)
+    execute_stat_func_test(
+        mpcstats_lib.five_number_summary,
+        five_number_summary,
+        num_params = 1,
+        player_data = player_data,
+        selected_col = 1,
+        tolerance = TOLERANCE_SMALL,
+        vector_res_parser = lambda x: x,
+    )
+
 def test_where_success():
     player_data = [
         [
@@ -300,6 +354,29 @@ def test_join_success():
         ],
     )
 
+def test_join_with_mask_success():
+    execute_join_test(
+        lambda *args: mpcstats_lib.join_with_mask(*args)[1],
+        [
+            [
+                [0, 1, 2, 3],
+                [152, M, 170, 180],
+            ],
+            [
+                [3, 0, 4],
+                [M, 60, 70],
+            ],
+        ],
+        0,
+        0,
+        [
+            [1, 1, 1, 1],
+            [1, 0, 1, 1],
+            [1, 0, 0, 1],
+            [1, 0, 0, 0],
+        ],
+    )
+
 def test_mode_success():
     test_cases = [
         pd1([11, 99, 100, M]),
@@ -350,6 +427,17 @@ def test_mode_fail_all_magic_numbers():
         tolerance = TOLERANCE_SMALL,
     )
 
+def test_read_data_run_time_rows_success():
+    player_data = gen_player_data(20, 2, 2, -100, 100, 0.2)
+    res = execute_read_data_test(player_data, 1, max_rows = 30)
+    exp = statistics.mean(x for x in player_data[0][1] if x != M)
+    assert_mp_py_diff(res, exp, TOLERANCE_SMALL)
+
+def test_read_data_run_time_rows_exceed_max_rows():
+    player_data = gen_player_data(20, 2, 2, -100, 100, 0.2)
+    with pytest.raises(Exception, match='(?i)crash'):
+        execute_read_data_test(player_data, 1, max_rows = 10)
+
 def test_mean_success():
     player_data = gen_player_data(30, 2, 2, -100, 100, 0.5)
     execute_stat_func_test(
@@ -361,6 +449,17 @@ def test_mean_success():
         tolerance = TOLERANCE_SMALL,
     )
 
+def test_mean_with_mask_success():
+    player_data = gen_player_data(30, 2, 2, -100, 100, 0.5)
+    execute_stat_func_test(
+        lambda col: mpcstats_lib.mean(col, mpcstats_lib.valid_mask(col)),
+        statistics.mean,
+        num_params = 1,
+        player_data = player_data,
+        selected_col = 1,
+        tolerance = TOLERANCE_SMALL,
+    )
+
 def test_variance_success():
     player_data = gen_player_data(30, 2, 2, -100, 100, 0.5)
     execute_stat_func_test(
@@ -387,6 +486,46 @@ def test_linear_regression_success():
         vector_res_parser = vector_res_parser,
     )
 
+def test_describe_success():
+    def mpc_describe(col1, col2):
+        stats = mpcstats_lib.describe([col1, col2])
+        res = sfix.Array(8)
+        res.assign([
+            stats['mean'][0],
+            stats['mean'][1],
+            stats['variance'][0],
+            stats['pvariance'][1],
+            stats['stdev'][0],
+            stats['pstdev'][1],
+            stats['covariance'][0][1],
+            stats['correlation'][1][0],
+        ])
+        return res
+
+    def py_describe(col1, col2):
+        return [
+            statistics.mean(col1),
+            statistics.mean(col2),
+            statistics.variance(col1),
+            statistics.pvariance(col2),
+            statistics.stdev(col1),
+            statistics.pstdev(col2),
+            statistics.covariance(col1, col2),
+            statistics.correlation(col1, col2),
+        ]
+
+    player_data = gen_player_data(30, 2, 2, -100, 100, 0.5)
+    execute_stat_func_test(
+        mpc_describe,
+        py_describe,
+        num_params = 2,
+        player_data = player_data,
+        selected_col = 1,
+        # due to use of sfix and sqrt, the result can differ up to 5%
+        tolerance = 0.05,
+        vector_res_parser = lambda x: x,
+    )
+
 def test_harmonic_mean_non_zero_input_success():
     # python harmonic_mean doesn't support negative values
     player_data = gen_player_data(30, 2, 2, 1, 100, 0.5)
@@ -446,4 +585,3 @@ def test_stdev_success():
         # due to use of sfix and sqrt, the result can differ up to 5%
         tolerance = 0.05,
     )
-